@@ -1,36 +1,89 @@
-from dash import Dash, dcc, html, Input, Output
-import plotly.express as px
-import plotly.graph_objects as go
+from dash import (
+    Dash, DiskcacheManager, ClientsideFunction, dcc, html,
+    Input, Output, State, Patch, no_update,
+)
+from dash.exceptions import PreventUpdate
+from flask_compress import Compress
+from plotly.io.json import to_json_plotly
 import pandas as pd
+import numpy as np
+import psutil
 import textwrap
 import os
+import hashlib
+import threading
+import time
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from functools import lru_cache, partial
+
+import cache
+import datastore
+import figures
+import geometry
+import kmeans
+import metrics
+import profiling
+import warmup
 
 # ============================
 # 1. CARGA Y PREPROCESADO
 # ============================
 
-df = pd.read_csv("DataExtract.csv")
-
-cols = [
-    "Country", "Year", "Air Pollutant", "Air Pollutant Description",
-    "Data Aggregation Process", "Spatial Resolution Description",
-    "Temporal Resolution", "Meteorology", "Chemistry", "Emissions", "Topography",
-    "Assessment Type", "Administration Level", "Model Application"
-]
-
-data = df[cols].copy()
-data = data.dropna(subset=["Country", "Year", "Air Pollutant"])
-data["Year"] = pd.to_numeric(data["Year"], errors="coerce")
-data = data.dropna(subset=["Year"])
-data["Year"] = data["Year"].astype(int)
-
-for c in ["Country", "Air Pollutant", "Data Aggregation Process"]:
-    data[c] = data[c].astype(str).str.strip()
-
-pollutants = sorted(data["Air Pollutant"].dropna().unique().tolist())
-countries = ["Todos los países"] + sorted(data["Country"].dropna().unique().tolist())
-
-ymin, ymax = int(data["Year"].min()), int(data["Year"].max())
+# DATA_FILE puede ser un CSV, un directorio o un patrón glob de extractos.
+DATA_FILE = os.environ.get("DATA_FILE", "DataExtract.csv")
+
+# El CSV limpio se lee del snapshot columnar (dataset.py) si está al día;
+# si no, se parsean los extractos y se regenera el snapshot. El dataset y lo
+# que se deriva de él (índice de filas, cubo de recuentos, sumas por año y
+# versión) viven en datastore, que lo recarga en caliente si cambia el
+# origen: los callbacks leen siempre datastore.current().
+datastore.load(DATA_FILE)
+
+# Valores iniciales de los filtros; tras una recarga los actualiza
+# refresh_filters.
+pollutants = datastore.current().pollutants
+countries = ["Todos los países"] + datastore.current().countries
+
+ymin, ymax = datastore.current().ymin, datastore.current().ymax
+
+LIVE_BUDGET_MS = float(os.environ.get("LIVE_BUDGET_MS", 150))
+
+# Presupuesto de datos de cada figura: aunque se elijan todos los
+# contaminantes, el navegador nunca recibe figuras sin límite. Lo que no
+# cabe se agrupa en una categoría "Otros".
+#   FIGURE_MAX_TRACES   series de evolución y procesos (incluida "Otros")
+#   FIGURE_MAX_POINTS   puntos por figura (barras, puntos de línea, hojas)
+#   FIGURE_MAX_LEAVES   hojas del treemap (incluidas las "Otros")
+FIGURE_MAX_TRACES = int(os.environ.get("FIGURE_MAX_TRACES", 6))
+FIGURE_MAX_POINTS = int(os.environ.get("FIGURE_MAX_POINTS", 300))
+FIGURE_MAX_LEAVES = int(os.environ.get("FIGURE_MAX_LEAVES", 60))
+
+RANKING_TOP = 20
+PROCESS_TOP = 10
+OTHERS_COLOR = "#9ca3af"
+
+# Cada cuánto pregunta el navegador por un callback en segundo plano.
+JOB_POLL_MS = int(os.environ.get("JOB_POLL_MS", 300))
+# Segundos que se guardan las métricas de un trabajo que nadie recoge.
+JOB_METRICS_TTL = 600
+
+# Compresión de las respuestas (brotli o gzip, según acepte el navegador).
+COMPRESS = os.environ.get("COMPRESS", "1") == "1"
+
+# Hilos para construir a la vez las figuras de una pestaña (0: tantos como
+# núcleos tenga el contenedor; 1: en serie).
+FIGURE_WORKERS = int(os.environ.get("FIGURE_WORKERS", 0))
+
+# Modo cliente: el navegador recibe una vez los recuentos agregados
+# (client_store) y recalcula él mismo KPIs, mapa, ranking y evolución en
+# callbacks del navegador (assets/clientside.js), sin ir al servidor. El
+# servidor sigue calculando procesos, treemap y segmentación.
+CLIENT_MODE = os.environ.get("CLIENT_MODE", "0") == "1"
+
+# Valores de k del slider de segmentación; se resuelven todos a la vez.
+SEGMENT_KS = range(2, 7)
+SEGMENT_FEATURES = ["Model_Count", "Pollutant_Count", "Process_Count", "Year_Count"]
 
 # ============================
 # 2. ESTILO GLOBAL
@@ -49,39 +102,51 @@ GRAPH_CONFIG = {
         "width": 1000,
         "scale": 2,
     },
+    # Geometría de los mapas servida por la propia app (geometry.py).
+    "topojsonURL": geometry.TOPOJSON_URL,
 }
 
-def style_fig(fig, title=None):
-    fig.update_layout(
-        title=title or fig.layout.title.text,
-        template="plotly_white",
-        paper_bgcolor="rgba(0,0,0,0)",
-        plot_bgcolor="rgba(0,0,0,0)",
-        margin=dict(l=40, r=20, t=70, b=40),
-        font=dict(
-            family="Segoe UI, system-ui, -apple-system, sans-serif",
-            size=12,
-            color="#212529",
-        ),
-        title_font=dict(
-            size=18,
-            family="Segoe UI, system-ui, -apple-system, sans-serif",
-        ),
-        legend=dict(
-            orientation="h",
-            yanchor="bottom",
-            y=-0.25,
-            xanchor="left",
-            x=0,
-        ),
-        hoverlabel=dict(
-            bgcolor="white",
-            bordercolor="#9ca3af",
-            font_size=12,
-            font_family="Segoe UI, system-ui, -apple-system, sans-serif",
-        ),
+# El estilo de las figuras (fuentes, márgenes, leyenda, hoverlabel) está
+# registrado como plantilla de Plotly en figures.py.
+
+# Figura inicial de los gráficos que se calculan en segundo plano.
+PLACEHOLDER = figures.empty("Calculando…")
+
+
+def year_marks(ymin, ymax):
+    return {
+        y: str(y)
+        for y in range(ymin, ymax + 1, max(1, (ymax - ymin) // 5 or 1))
+    }
+
+
+def job_progress(tab):
+    return html.Div(
+        id=f"job-{tab}",
+        style=JOB_HIDDEN,
+        children=[
+            html.Progress(id=f"pb-{tab}", value="0", max="1", style={"width": "160px"}),
+            html.Span(id=f"txt-{tab}"),
+        ],
     )
-    return fig
+
+
+def job_outputs(tab):
+    # progress y running de Dash para la fila de progreso de una pestaña.
+    return {
+        "progress": [
+            Output(f"pb-{tab}", "value"),
+            Output(f"pb-{tab}", "max"),
+            Output(f"txt-{tab}", "children"),
+        ],
+        "progress_default": ["0", "1", ""],
+        "running": [(Output(f"job-{tab}", "style"), JOB_STYLE, JOB_HIDDEN)],
+    }
+
+
+def report(set_progress, done, total, label):
+    if set_progress is not None:
+        set_progress([str(done), str(total), label])
 
 
 def format_int(n):
@@ -90,13 +155,111 @@ def format_int(n):
     except Exception:
         return "0"
 
+
+def client_store(state):
+    # Datos de cube-store para el modo cliente: recuentos País ×
+    # Contaminante × Año (procesos sumados) como typed array, las etiquetas
+    # de cada eje y lo necesario para construir las figuras como
+    # figures.build (plantilla, esqueletos, colores y presupuesto).
+    sel = state.select(state.pollutants, state.ymin, state.ymax)
+    return {
+        "version": state.version,
+        "countries": sel.countries,
+        "codes": [state.country_codes.get(c) for c in sel.countries],
+        "pollutants": sel.pollutants,
+        "years": [int(y) for y in sel.years],
+        "counts": figures.typed(sel.counts.sum(axis=3)),
+        "figures": {
+            "template": figures.TEMPLATE,
+            "skeletons": {kind: figures.SKELETONS[kind] for kind in ("map", "ranking", "trend")},
+            "colors": figures.COLORS,
+            "others": OTHERS_COLOR,
+        },
+        "budget": {
+            "traces": FIGURE_MAX_TRACES,
+            "points": FIGURE_MAX_POINTS,
+            "ranking": RANKING_TOP,
+        },
+    }
+
 # ============================
 # 3. APP
 # ============================
 
-app = Dash(__name__)
+# Los gráficos pesados se calculan como callbacks en segundo plano: cada
+# ejecución es un proceso aparte y la petición del worker solo lo lanza y
+# consulta su progreso, así que un filtro costoso no ocupa el worker.
+
+class JobManager(DiskcacheManager):
+
+    def terminate_job(self, job):
+        # Dash mata el proceso del trabajo y espera hasta 1 s a que
+        # desaparezca, pero uno lanzado por otro worker sigue existiendo
+        # (zombi) hasta que su padre lo recoge y la espera se agota entera:
+        # a esos se les mata sin esperar.
+        if job is None:
+            return
+        try:
+            process = psutil.Process(int(job))
+            if process.ppid() != os.getpid():
+                if process.status() != psutil.STATUS_ZOMBIE:
+                    process.kill()
+                return
+        except psutil.NoSuchProcess:
+            return
+        super().terminate_job(job)
+
+    def make_job_fn(self, fn, progress, key=None):
+        # Lo que mide el callback en el proceso del trabajo (metrics) y su
+        # perfil (profiling) se guardan junto al resultado, antes que él, y
+        # get_result los pasa a la petición que lo recoge.
+        handle = self.handle
+
+        def job_fn(result_key, progress_key, args, context):
+            def measured(*fn_args, **fn_kwargs):
+                metrics.export()    # lo heredado de la petición que lo lanzó
+                try:
+                    return fn(*fn_args, **fn_kwargs)
+                finally:
+                    handle.set(
+                        f"{result_key}-metrics",
+                        {"metrics": metrics.export(), "profile": profiling.export()},
+                        expire=JOB_METRICS_TTL,
+                    )
+
+            run = super(JobManager, self).make_job_fn(measured, progress, key)
+            run(result_key, progress_key, args, context)
+
+        return job_fn
+
+    def get_result(self, key, job):
+        result = super().get_result(key, job)
+        if result is not self.UNDEFINED:
+            sample = self.handle.pop(f"{key}-metrics", default=None)
+            if sample is not None:
+                metrics.merge(sample["metrics"])
+                profiling.merge(sample["profile"])
+        return result
+
+
+app = Dash(__name__, background_callback_manager=JobManager(cache.jobs))
 server = app.server     # <- Necesario para Render
 
+# /metrics y cabeceras Server-Timing (metrics.py); perfilado bajo demanda y
+# rutas /admin/profiles (profiling.py); /health con el progreso del
+# precalentamiento de la caché (warmup.py); topojson de los mapas
+# (geometry.py)
+metrics.register(server)
+profiling.register(server)
+warmup.register(server)
+geometry.register(server)
+
+# Las respuestas de los callbacks (JSON) y los bundles de Dash se comprimen
+# con brotli si el navegador lo acepta y con gzip si no.
+if COMPRESS:
+    server.config["COMPRESS_ALGORITHM"] = ["br", "gzip"]
+    Compress(server)
+
 app.title = "EEA Air Quality Models"
 
 CARD_STYLE = {
@@ -106,6 +269,18 @@ CARD_STYLE = {
     "boxShadow": "0 4px 10px rgba(15, 23, 42, 0.06)",
 }
 
+# Fila de progreso de los callbacks en segundo plano; solo se ve mientras
+# hay un cálculo en curso (running de cada callback).
+JOB_STYLE = {
+    "display": "flex",
+    "alignItems": "center",
+    "gap": "10px",
+    "marginTop": "12px",
+    "fontSize": "12px",
+    "color": "#6b7280",
+}
+JOB_HIDDEN = {**JOB_STYLE, "display": "none"}
+
 KPI_CARD_STYLE = {
     **CARD_STYLE,
     "textAlign": "center",
@@ -228,17 +403,25 @@ app.layout = html.Div(
                                     max=ymax,
                                     step=1,
                                     value=[max(ymin, ymax - 10), ymax],
-                                    marks={
-                                        y: str(y)
-                                        for y in range(
-                                            ymin,
-                                            ymax + 1,
-                                            max(1, (ymax - ymin) // 5 or 1),
-                                        )
-                                    },
+                                    marks=year_marks(ymin, ymax),
                                     tooltip={"placement": "bottom"},
                                     allowCross=False,
                                 ),
+                                dcc.Checklist(
+                                    id="chk-live",
+                                    options=[{
+                                        "label": " Actualizar mapa, ranking y evolución al arrastrar",
+                                        "value": "live",
+                                        "disabled": datastore.current().year_prefix is None,
+                                    }],
+                                    value=[],
+                                    # En modo cliente los gráficos ya siguen al slider.
+                                    style={
+                                        "fontSize": "12px",
+                                        "color": "#6b7280",
+                                        **({"display": "none"} if CLIENT_MODE else {}),
+                                    },
+                                ),
                             ],
                         ),
 
@@ -393,6 +576,26 @@ app.layout = html.Div(
                 # =====================================
                 # TABS PRINCIPALES
                 # =====================================
+                # Firmas de las figuras que tiene el navegador (ver figure_updates)
+                dcc.Store(id="sig-overview", data={}),
+                dcc.Store(id="sig-model", data={}),
+                dcc.Store(id="sig-tree", data={}),
+                # Peticiones de cálculo en segundo plano de cada pestaña
+                dcc.Store(id="req-overview"),
+                dcc.Store(id="req-model"),
+                dcc.Store(id="req-tree"),
+
+                # Versión del dataset que reflejan los filtros (refresh_filters)
+                dcc.Store(id="data-version", data=datastore.current().version),
+                # Recuentos agregados para los callbacks del navegador
+                *([dcc.Store(id="cube-store", data=client_store(datastore.current()))]
+                  if CLIENT_MODE else []),
+                dcc.Interval(
+                    id="data-poll",
+                    interval=max(datastore.RELOAD_INTERVAL, 1) * 1000,
+                    disabled=datastore.RELOAD_INTERVAL <= 0,
+                ),
+
                 dcc.Tabs(
                     id="tabs-main",
                     value="tab-overview",
@@ -417,6 +620,7 @@ app.layout = html.Div(
                                 "background": "rgba(255,255,255,0.7)",
                             },
                             children=[
+                                job_progress("overview"),
 
                                 # -----------------------------
                                 # FILA 1 — MAPA + RANKING
@@ -439,6 +643,7 @@ app.layout = html.Div(
                                                     children=[
                                                         dcc.Graph(
                                                             id="fig-map",
+                                                            figure=PLACEHOLDER,
                                                             style={"height": "420px"},
                                                             config=GRAPH_CONFIG,
                                                         )
@@ -461,6 +666,7 @@ app.layout = html.Div(
                                                     children=[
                                                         dcc.Graph(
                                                             id="fig-ranking",
+                                                            figure=PLACEHOLDER,
                                                             style={"height": "420px"},
                                                             config=GRAPH_CONFIG,
                                                         )
@@ -486,6 +692,7 @@ app.layout = html.Div(
                                             children=[
                                                 dcc.Graph(
                                                     id="fig-trend",
+                                                    figure=PLACEHOLDER,
                                                     style={"height": "380px"},
                                                     config=GRAPH_CONFIG,
                                                 )
@@ -509,6 +716,7 @@ app.layout = html.Div(
                                             children=[
                                                 dcc.Graph(
                                                     id="fig-process",
+                                                    figure=PLACEHOLDER,
                                                     style={"height": "420px"},
                                                     config=GRAPH_CONFIG,
                                                 )
@@ -533,6 +741,7 @@ app.layout = html.Div(
                                 "background": "rgba(255,255,255,0.7)",
                             },
                             children=[
+                                job_progress("model"),
                                 html.Div(
                                     style={"marginTop": "18px"},
                                     children=[
@@ -551,8 +760,9 @@ app.layout = html.Div(
                                                     },
                                                 ),
                                                 html.P(
-                                                    "Se calcula un score por país combinando número de modelos y "
-                                                    "diversidad de contaminantes. Luego se agrupan en k segmentos.",
+                                                    "Cada país se describe por su número de modelos y su diversidad de "
+                                                    "contaminantes, procesos y años cubiertos, y se agrupa en k "
+                                                    "segmentos con k-means.",
                                                     style={
                                                         "fontSize": "13px",
                                                         "color": "#4b5563",
@@ -570,11 +780,11 @@ app.layout = html.Div(
                                                 ),
                                                 dcc.Slider(
                                                     id="sl-k",
-                                                    min=2,
-                                                    max=6,
+                                                    min=SEGMENT_KS[0],
+                                                    max=SEGMENT_KS[-1],
                                                     step=1,
                                                     value=3,
-                                                    marks={k: str(k) for k in range(2, 7)},
+                                                    marks={k: str(k) for k in SEGMENT_KS},
                                                 ),
                                             ],
                                         ),
@@ -588,6 +798,7 @@ app.layout = html.Div(
                                                     children=[
                                                         dcc.Graph(
                                                             id="fig-cluster",
+                                                            figure=PLACEHOLDER,
                                                             style={"height": "420px"},
                                                             config=GRAPH_CONFIG,
                                                         )
@@ -596,6 +807,24 @@ app.layout = html.Div(
                                             ],
                                         ),
 
+                                        # Método del codo: inercia para cada k
+                                        html.Div(
+                                            style={**CARD_STYLE, "marginBottom": "16px"},
+                                            children=[
+                                                dcc.Loading(
+                                                    type="circle",
+                                                    children=[
+                                                        dcc.Graph(
+                                                            id="fig-elbow",
+                                                            figure=PLACEHOLDER,
+                                                            style={"height": "300px"},
+                                                            config=GRAPH_CONFIG,
+                                                        )
+                                                    ],
+                                                )
+                                            ],
+                                        ),
+
                                         # Explicación de los clústers
                                         html.Div(
                                             style={**CARD_STYLE},
@@ -620,6 +849,7 @@ app.layout = html.Div(
                                 "background": "rgba(255,255,255,0.7)",
                             },
                             children=[
+                                job_progress("tree"),
                                 html.Div(
                                     style={**CARD_STYLE, "marginTop": "18px"},
                                     children=[
@@ -646,6 +876,7 @@ app.layout = html.Div(
                                             children=[
                                                 dcc.Graph(
                                                     id="fig-treemap",
+                                                    figure=PLACEHOLDER,
                                                     style={"height": "520px"},
                                                     config=GRAPH_CONFIG,
                                                 )
@@ -688,7 +919,7 @@ app.layout = html.Div(
 - **Ranking:** ordena los países por número de modelos.
 - **Evolución temporal:** muestra si aumenta, se mantiene o cae la modelización.
 - **Procesos:** compara tipos de proceso más utilizados en los países más activos.
-- **Segmentación:** k-means simplificado basado en score de intensidad.
+- **Segmentación:** k-means (inicialización k-means++) sobre número de modelos (en escala logarítmica), contaminantes, procesos y años cubiertos por país, normalizados a [0, 1]. El gráfico del codo muestra la inercia de cada k.
 - **Treemap:** composición contaminante–país del total de modelos declarados.
 
 Datos procedentes del repositorio de *EEA Air Quality Models*.
@@ -721,333 +952,1072 @@ Datos procedentes del repositorio de *EEA Air Quality Models*.
     ],
 )
 # ============================================================
-# 5. CALLBACKS
+# 5. CONSTRUCCIÓN DE GRÁFICOS
 # ============================================================
 
-@app.callback(
-    [
-        Output("kpi-models", "children"),
-        Output("kpi-countries", "children"),
-        Output("kpi-pollutants", "children"),
-        Output("fig-map", "figure"),
-        Output("fig-ranking", "figure"),
-        Output("fig-trend", "figure"),
-        Output("fig-process", "figure"),
-        Output("fig-cluster", "figure"),
-        Output("fig-treemap", "figure"),
-        Output("txt-k-explanation", "children"),
-    ],
-    [
-        Input("dd-pol", "value"),
-        Input("sl-year", "value"),
-        Input("dd-country", "value"),
-        Input("sl-k", "value"),
-    ],
-)
-def update_dashboard(pol_list, year_range, country, k):
-
-    empty_fig = style_fig(go.Figure(), "Sin datos")
-    empty_explanation = [
+def empty_explanation():
+    return [
         html.P(
             "Ajusta los filtros y selecciona un valor de k para ver la segmentación.",
             style={"fontSize": "13px", "color": "#6b7280", "margin": "0"},
         )
     ]
 
-    if not pol_list or year_range is None or k is None:
-        return (
-            "0", "0", "0",
-            empty_fig, empty_fig, empty_fig, empty_fig, empty_fig, empty_fig,
-            empty_explanation
-        )
 
+def filter_key(pol_list, year_range, country):
+    # Estado canónico de los filtros: el orden de selección de los
+    # contaminantes no cambia el resultado.
+    return (
+        tuple(sorted(set(pol_list))),
+        int(year_range[0]),
+        int(year_range[1]),
+        country,
+    )
+
+
+def view_key(section, version, pol_list, year_range, country, k=None):
+    return (section, version, *filter_key(pol_list, year_range, country), k)
+
+
+# Propiedades de las trazas que solo llevan datos. Si dos figuras coinciden
+# en todo lo demás (tipo y nombre de trazas, estilos, layout), el navegador ya
+# tiene la estructura y basta con enviarle esos arrays como dash.Patch. Los
+# de marker (colores del treemap, tamaño y color de los puntos del codo)
+# van aparte porque son claves anidadas.
+DATA_KEYS = (
+    "x", "y", "z", "locations", "labels", "parents", "ids", "values",
+    "customdata", "text", "hovertext",
+)
+MARKER_DATA_KEYS = ("colors", "color", "size")
+
+
+def figure_signature(fig):
+    def skeleton(trace):
+        out = {k: ("*" if k in DATA_KEYS else v) for k, v in trace.items()}
+        if "marker" in out:
+            out["marker"] = {
+                k: ("*" if k in MARKER_DATA_KEYS else v) for k, v in out["marker"].items()
+            }
+        return out
+
+    structure = {
+        "data": [skeleton(t) for t in fig.get("data", [])],
+        "layout": fig.get("layout", {}),
+    }
+    return hashlib.sha1(to_json_plotly(structure).encode()).hexdigest()
+
+
+def figure_patch(fig):
+    patch = Patch()
+    for i, trace in enumerate(fig.get("data", [])):
+        for key in DATA_KEYS:
+            if key in trace:
+                patch["data"][i][key] = trace[key]
+        for key in MARKER_DATA_KEYS:
+            if key in trace.get("marker", {}):
+                patch["data"][i]["marker"][key] = trace["marker"][key]
+    return patch
+
+
+def figure_updates(figs, signatures, full=()):
+    # figs: {id del gráfico: figura (dict) o no_update}. Devuelve lo que se
+    # envía a cada gráfico y las firmas que quedan en el navegador. full:
+    # gráficos que otro callback puede haber reemplazado (modo en vivo), así
+    # que su firma no describe lo que hay en el navegador: van enteros y su
+    # firma se olvida.
+    signatures = dict(signatures or {})
+    outputs = []
+    for fig_id, fig in figs.items():
+        if fig is no_update:
+            outputs.append(no_update)
+            continue
+        if fig_id in full:
+            outputs.append(fig)
+            signatures.pop(fig_id, None)
+            continue
+        sig = figure_signature(fig)
+        outputs.append(figure_patch(fig) if signatures.get(fig_id) == sig else fig)
+        signatures[fig_id] = sig
+    return outputs, signatures
+
+
+@metrics.timed("filter")
+def select_cube(state, pol_list, year_range, country):
     y0, y1 = int(year_range[0]), int(year_range[1])
-    d = data[
-        (data["Air Pollutant"].isin(pol_list))
-        & (data["Year"].between(y0, y1))
-    ].copy()
-
-    if country != "Todos los países":
-        d = d[d["Country"] == country]
-
-    # =======================
-    # KPIs
-    # =======================
-    n_models = len(d)
-    n_countries = d["Country"].nunique()
-    n_polls = d["Air Pollutant"].nunique()
-
-    # =======================
-    # MAPA
-    # =======================
-    geo = d.groupby("Country").size().reset_index(name="Model Count")
+    return state.select(
+        pol_list, y0, y1,
+        None if country == "Todos los países" else country,
+    )
+
+
+@metrics.timed("filter")
+def select_live(state, pol_list, y0, y1, country):
+    return state.year_prefix.select(
+        pol_list, y0, y1,
+        None if country == "Todos los países" else country,
+    )
+
+
+@metrics.timed("kpis")
+def build_kpis(sel):
+    return (
+        format_int(sel.total()),
+        format_int(sel.n_countries()),
+        format_int(sel.n_pollutants()),
+    )
+
+
+@metrics.timed("map")
+def build_map(sel, codes):
+    # codes: {país: ISO-3} (DatasetState.country_codes).
+    geo = sel.by_country()
+    geo = geo.assign(Code=geo["Country"].map(codes)).dropna(subset=["Code"])
 
     if geo.empty:
-        fig_map = style_fig(go.Figure(), "Sin datos para mapa")
+        return figures.empty("Sin datos para mapa")
+
+    return figures.build(
+        "map",
+        "Distribución europea de modelos",
+        [{
+            "locations": geo["Code"].tolist(),
+            "text": geo["Country"].tolist(),
+            "z": geo["Model Count"].to_numpy(),
+        }],
+    )
+
+
+def top_k(values, k):
+    # Posiciones de los k mayores de values, de mayor a menor y con los
+    # empates por orden de posición (como un sort estable + head), pero con
+    # selección parcial: el resto no se ordena.
+    values = np.asarray(values)
+    n = len(values)
+    k = max(0, min(k, n))
+    if k < n:
+        threshold = np.partition(values, n - k)[n - k] if k else np.inf
+        above = np.flatnonzero(values > threshold)
+        tied = np.flatnonzero(values == threshold)[:k - len(above)]
+        idx = np.concatenate([above, tied])
     else:
-        fig_map = px.choropleth(
-            geo,
-            locations="Country",
-            locationmode="country names",
-            color="Model Count",
-            color_continuous_scale=px.colors.sequential.YlGnBu,
-            scope="europe",
-        )
-        fig_map = style_fig(fig_map, "Distribución europea de modelos")
-        fig_map.update_layout(coloraxis_colorbar=dict(title="Modelos"))
-        fig_map.update_traces(
-            hovertemplate="<b>%{location}</b><br>Modelos: %{z}<extra></extra>"
-        )
+        idx = np.arange(n)
+    return idx[np.argsort(-values[idx], kind="stable")]
 
-    # =======================
-    # RANKING
-    # =======================
-    rank = (
-        d.groupby("Country")
-        .size()
-        .reset_index(name="Model Count")
-        .sort_values("Model Count", ascending=False)
-        .head(20)
-    )
+
+def fold_tail(labels, weights, n, other):
+    # Si hay más de n categorías se quedan las n - 1 de más peso (weights:
+    # Series por categoría) y el resto pasa a other. Devuelve labels con las
+    # categorías ya agrupadas.
+    if len(weights) <= n:
+        return labels
+    keep = weights.index[top_k(weights.to_numpy(), n - 1)]
+    return labels.where(labels.isin(keep), other)
+
+
+@metrics.timed("ranking")
+def build_ranking(sel):
+    rank = sel.by_country()
+    rank = rank.iloc[top_k(rank["Model Count"].to_numpy(), min(RANKING_TOP, FIGURE_MAX_POINTS))]
 
     if rank.empty:
-        fig_rank = style_fig(go.Figure(), "Sin datos para ranking")
-    else:
-        fig_rank = px.bar(
-            rank,
-            x="Model Count",
-            y="Country",
-            orientation="h",
-        )
-        fig_rank.update_layout(yaxis={"categoryorder": "total ascending"})
-        fig_rank = style_fig(fig_rank, "Ranking de países por número de modelos")
-        fig_rank.update_traces(
-            hovertemplate="<b>%{y}</b><br>Modelos: %{x}<extra></extra>"
-        )
+        return figures.empty("Sin datos para ranking")
 
-    # =======================
-    # EVOLUCIÓN TEMPORAL
-    # =======================
-    trend = (
-        d.groupby(["Year", "Air Pollutant"])
-        .size()
-        .reset_index(name="Model Count")
+    return figures.build(
+        "ranking",
+        "Ranking de países por número de modelos",
+        [{"x": rank["Model Count"].to_numpy(), "y": rank["Country"].tolist()}],
     )
 
+
+@metrics.timed("trend")
+def build_trend(sel, y0, y1):
+    trend = sel.by_year_pollutant()
+
     if trend.empty:
-        fig_trend = style_fig(go.Figure(), "Sin datos para evolución")
-    else:
-        fig_trend = px.line(
-            trend,
-            x="Year",
-            y="Model Count",
-            color="Air Pollutant",
-            markers=True,
-        )
-        fig_trend.update_layout(
-            xaxis=dict(dtick=max(1, (y1 - y0) // 10 or 1)),
-            hovermode="x unified",
-        )
-        fig_trend = style_fig(fig_trend, "Evolución del número de modelos por año")
-        fig_trend.update_traces(
-            hovertemplate="<b>Año %{x}</b><br>Modelos: %{y}<extra></extra>"
+        return figures.empty("Sin datos para evolución")
+
+    # Como mucho FIGURE_MAX_TRACES series (y FIGURE_MAX_POINTS puntos): los
+    # contaminantes con menos modelos se suman en una serie "Otros".
+    n = max(1, min(FIGURE_MAX_TRACES, FIGURE_MAX_POINTS // trend["Year"].nunique()))
+    totals = trend.groupby("Air Pollutant", sort=False)["Model Count"].sum()
+    if len(totals) > n:
+        trend = (
+            trend.assign(**{"Air Pollutant": fold_tail(trend["Air Pollutant"], totals, n, "Otros")})
+            .groupby(["Air Pollutant", "Year"], sort=False)["Model Count"]
+            .sum()
+            .reset_index()
         )
 
-    # =======================
-    # PROCESOS
-    # =======================
-    if "Data Aggregation Process" in d.columns:
-        proc = (
-            d.groupby(["Country", "Data Aggregation Process"])
-            .size()
-            .reset_index(name="Count")
-        )
+    groups = dict(tuple(trend.groupby("Air Pollutant", sort=False)))
+    order = [pol for pol in groups if pol != "Otros"] + (["Otros"] if "Otros" in groups else [])
+    traces = []
+    for i, pol in enumerate(order):
+        g = groups[pol].sort_values("Year")
+        color = OTHERS_COLOR if pol == "Otros" else figures.COLORS[i % len(figures.COLORS)]
+        traces.append({
+            "name": pol,
+            "legendgroup": pol,
+            "line": {"color": color, "dash": "solid"},
+            "x": g["Year"].to_numpy(),
+            "y": g["Model Count"].to_numpy(),
+        })
+
+    return figures.build(
+        "trend",
+        "Evolución del número de modelos por año",
+        traces,
+        xaxis={"title": {"text": "Year"}, "dtick": max(1, (y1 - y0) // 10 or 1)},
+    )
 
-        if proc.empty:
-            fig_proc = style_fig(go.Figure(), "Sin datos de procesos")
-        else:
-            top_countries = (
-                proc.groupby("Country")["Count"]
-                .sum()
-                .sort_values(ascending=False)
-                .head(10)
-                .index
-            )
-            proc = proc[proc["Country"].isin(top_countries)]
 
-            process_totals = (
-                proc.groupby("Data Aggregation Process")["Count"]
-                .sum()
-                .sort_values(ascending=False)
-            )
+@metrics.timed("processes")
+def build_process(sel):
+    proc = sel.by_country_process()
 
-            top_processes = process_totals.head(5).index
+    if proc.empty:
+        return figures.empty("Sin datos de procesos")
 
-            proc["ProcessGroup"] = proc["Data Aggregation Process"].where(
-                proc["Data Aggregation Process"].isin(top_processes),
-                "Otros procesos",
-            )
+    # Top de países (PROCESS_TOP, dentro de FIGURE_MAX_POINTS barras entre
+    # todas las series) y los procesos que no caben en FIGURE_MAX_TRACES
+    # agrupados en "Otros procesos".
+    n_countries = max(1, min(PROCESS_TOP, FIGURE_MAX_POINTS // FIGURE_MAX_TRACES))
+    country_totals = proc.groupby("Country", sort=False)["Count"].sum()
+    top_countries = country_totals.index[top_k(country_totals.to_numpy(), n_countries)]
+    proc = proc[proc["Country"].isin(top_countries)]
 
-            proc["ProcessLabel"] = proc["ProcessGroup"].apply(
-                lambda s: "<br>".join(textwrap.wrap(str(s), width=18))
-            )
+    process_totals = proc.groupby("Data Aggregation Process", sort=False)["Count"].sum()
+    proc["ProcessGroup"] = fold_tail(
+        proc["Data Aggregation Process"], process_totals, FIGURE_MAX_TRACES, "Otros procesos",
+    )
 
-            proc_plot = (
-                proc.groupby(["Country", "ProcessLabel"])["Count"]
-                .sum()
-                .reset_index()
-            )
+    proc["ProcessLabel"] = proc["ProcessGroup"].apply(
+        lambda s: "<br>".join(textwrap.wrap(str(s), width=18))
+    )
 
-            fig_proc = px.bar(
-                proc_plot,
-                x="Count",
-                y="Country",
-                color="ProcessLabel",
-                barmode="stack",
-            )
-            fig_proc = style_fig(
-                fig_proc,
-                "Procesos de agregación por país (Top 10)",
-            )
-            fig_proc.update_layout(
-                xaxis_title="Número de modelos",
-                yaxis_title="País",
-                yaxis={"categoryorder": "total ascending"},
-                legend_title="Proceso",
-                margin=dict(l=80, r=230, t=70, b=40),
-            )
-            fig_proc.update_traces(
-                hovertemplate="<b>%{y}</b><br>Proceso: %{legendgroup}<br>Modelos: %{x}<extra></extra>"
-            )
-    else:
-        fig_proc = style_fig(go.Figure(), "Columna no encontrada")
+    proc_plot = (
+        proc.groupby(["Country", "ProcessLabel"])["Count"]
+        .sum()
+        .reset_index()
+    )
 
-    # =======================
-    # TREEMAP
-    # =======================
-    tm = d[["Air Pollutant", "Country"]].dropna()
+    traces = []
+    for i, (label, g) in enumerate(proc_plot.groupby("ProcessLabel", sort=False)):
+        traces.append({
+            "name": label,
+            "legendgroup": label,
+            "marker": {"color": figures.COLORS[i % len(figures.COLORS)]},
+            "x": g["Count"].to_numpy(),
+            "y": g["Country"].tolist(),
+        })
+
+    return figures.build(
+        "process",
+        f"Procesos de agregación por país (Top {len(top_countries)})",
+        traces,
+    )
 
-    if tm.empty:
-        fig_treemap = style_fig(go.Figure(), "Sin datos para treemap")
-    else:
-        tm_group = (
-            tm.groupby(["Air Pollutant", "Country"])
-            .size()
-            .reset_index(name="Count")
-        )
 
-        fig_treemap = px.treemap(
-            tm_group,
-            path=["Air Pollutant", "Country"],
-            values="Count",
-            color="Air Pollutant",
-            color_discrete_sequence=px.colors.qualitative.Set3,
+@metrics.timed("treemap")
+def build_treemap(sel):
+    tm_group = sel.by_pollutant_country()
+
+    if tm_group.empty:
+        return figures.empty("Sin datos para treemap")
+
+    # Nodos contaminante (raíz de cada rama) seguidos de sus hojas por país.
+    # Cada rama necesita al menos una hoja, así que los contaminantes no
+    # pueden ocupar más de la mitad del presupuesto: los de menos modelos se
+    # agrupan antes en una rama "Otros" con sus países.
+    budget = min(FIGURE_MAX_LEAVES, FIGURE_MAX_POINTS)
+    totals = tm_group.groupby("Air Pollutant", sort=False)["Count"].sum()
+    max_parents = max(1, budget // 2)
+    if len(totals) > max_parents:
+        tm_group = (
+            tm_group.assign(**{"Air Pollutant": fold_tail(
+                tm_group["Air Pollutant"], totals, max_parents, "Otros",
+            )})
+            .groupby(["Air Pollutant", "Country"], sort=False)["Count"].sum()
+            .reset_index()
         )
-        fig_treemap = style_fig(
-            fig_treemap,
-            "Composición de modelos por contaminante y país",
+        totals = tm_group.groupby("Air Pollutant", sort=False)["Count"].sum()
+    colors = {
+        pol: OTHERS_COLOR if pol == "Otros"
+        else figures.SEGMENT_COLORS[i % len(figures.SEGMENT_COLORS)]
+        for i, pol in enumerate(totals.index)
+    }
+
+    # Si no caben todas, se quedan las hojas con más modelos y el resto de
+    # cada contaminante se agrupa en una hoja "Otros (n)", que deja hueco
+    # para una por contaminante.
+    leaves = tm_group.assign(Label=tm_group["Country"])
+    if len(leaves) > budget:
+        keep = np.zeros(len(leaves), dtype=bool)
+        keep[top_k(leaves["Count"].to_numpy(), budget - len(totals))] = True
+        rest = (
+            leaves[~keep]
+            .groupby("Air Pollutant", sort=False)["Count"]
+            .agg(["sum", "size"])
+            .reset_index()
         )
+        leaves = pd.concat([
+            leaves[keep],
+            pd.DataFrame({
+                "Air Pollutant": rest["Air Pollutant"],
+                "Country": "Otros",
+                "Count": rest["sum"],
+                "Label": "Otros (" + rest["size"].astype(str) + ")",
+            }),
+        ], ignore_index=True)
+    leaf_ids = (leaves["Air Pollutant"] + "/" + leaves["Country"]).tolist()
+
+    return figures.build(
+        "treemap",
+        "Composición de modelos por contaminante y país",
+        [{
+            "ids": totals.index.tolist() + leaf_ids,
+            "labels": totals.index.tolist() + leaves["Label"].tolist(),
+            "parents": [""] * len(totals) + leaves["Air Pollutant"].tolist(),
+            "values": np.concatenate([totals.to_numpy(), leaves["Count"].to_numpy()]),
+            "marker": {"colors": [colors[p] for p in totals.index]
+                       + [colors[p] for p in leaves["Air Pollutant"]]},
+        }],
+    )
 
-    # =======================
-    # SEGMENTACIÓN DE PAÍSES
-    # =======================
-    seg = (
-        d.groupby("Country")
-        .agg(
-            Model_Count=("Country", "size"),
-            Pollutant_Count=("Air Pollutant", "nunique"),
-        )
-        .reset_index()
+
+def segment_features(seg):
+    # Variables del k-means normalizadas a [0, 1]; el nº de modelos, muy
+    # concentrado en pocos países, en escala logarítmica.
+    X = seg[SEGMENT_FEATURES].to_numpy(dtype=float, copy=True)
+    X[:, 0] = np.log1p(X[:, 0])
+    lo, span = X.min(axis=0), np.ptp(X, axis=0)
+    return (X - lo) / np.where(span > 0, span, 1)
+
+
+@metrics.timed("segmentation")
+def segment_solutions(sel, codes):
+    # Perfil por país y k-means de todas las k del slider para una selección,
+    # en una sola pasada. codes: {país: ISO-3} (DatasetState.country_codes).
+    seg = sel.country_profile()
+    seg["Code"] = seg["Country"].map(codes)
+
+    solutions = {}
+    if len(seg) >= 2:
+        solutions = kmeans.solve(segment_features(seg), SEGMENT_KS)
+    return seg, solutions
+
+
+@metrics.timed("elbow")
+def build_elbow(solutions, k):
+    ks = sorted(solutions)
+    if len(ks) < 2:
+        return figures.empty("Sin datos para el método del codo")
+
+    return figures.build(
+        "elbow",
+        "Método del codo: inercia por número de segmentos",
+        [{
+            "x": ks,
+            "y": [solutions[i].inertia for i in ks],
+            "marker": {
+                "size": [14 if i == k else 8 for i in ks],
+                "color": [figures.COLORS[1] if i == k else figures.COLORS[0] for i in ks],
+            },
+        }],
     )
 
-    if seg.empty or seg["Country"].nunique() < 2:
-        fig_cluster = style_fig(go.Figure(), "No hay suficientes datos")
-        explanation_children = empty_explanation
 
-    elif seg["Country"].nunique() < k:
-        fig_cluster = style_fig(go.Figure(), "No hay suficientes países para ese k")
-        explanation_children = empty_explanation
+@metrics.timed("segment_map")
+def build_segmentation(model, k):
+    seg, solutions = model
+    if seg.empty or seg["Country"].nunique() < 2:
+        return figures.empty("No hay suficientes datos"), empty_explanation()
 
-    else:
-        seg["Model_Count_norm"] = seg["Model_Count"] / seg["Model_Count"].max()
-        seg["Pollutant_Count_norm"] = seg["Pollutant_Count"] / seg["Pollutant_Count"].max()
-        seg["Score"] = 0.7 * seg["Model_Count_norm"] + 0.3 * seg["Pollutant_Count_norm"]
-
-        labels = [f"Segmento {i+1}" for i in range(k)]
-        seg["Segment"] = pd.qcut(
-            seg["Score"],
-            q=k,
-            labels=labels,
-            duplicates="drop",
+    if k not in solutions:
+        return (
+            figures.empty("No hay suficientes países para ese k"),
+            empty_explanation(),
         )
 
-        cats = list(seg["Segment"].cat.categories)
-        counts = seg["Segment"].value_counts().reindex(cats, fill_value=0)
-        total_countries = counts.sum()
-
-        fig_cluster = px.choropleth(
-            seg,
-            locations="Country",
-            locationmode="country names",
-            color="Segment",
-            scope="europe",
-            color_discrete_sequence=px.colors.qualitative.Set3,
+    # Segmentos numerados de menor a mayor intensidad (media del centro).
+    solution = solutions[k]
+    rank = np.empty(k, dtype=int)
+    rank[np.argsort(solution.centers.mean(axis=1), kind="stable")] = np.arange(k)
+    segment = rank[solution.labels]
+
+    # Un grupo puede quedar vacío si hay países con perfiles idénticos.
+    present = np.unique(segment)
+    cats = [f"Segmento {i+1}" for i in range(len(present))]
+    seg = seg.assign(Segment=pd.Categorical.from_codes(
+        np.searchsorted(present, segment), categories=cats,
+    ))
+
+    counts = seg["Segment"].value_counts().reindex(cats, fill_value=0)
+    total_countries = counts.sum()
+    means = seg.groupby("Segment", observed=True)[SEGMENT_FEATURES].mean()
+
+    traces = []
+    for i, label in enumerate(cats):
+        color = figures.SEGMENT_COLORS[i % len(figures.SEGMENT_COLORS)]
+        members = seg.loc[(seg["Segment"] == label) & seg["Code"].notna()]
+        traces.append({
+            "name": label,
+            "locations": members["Code"].tolist(),
+            "text": members["Country"].tolist(),
+            "z": [1] * len(members),
+            "colorscale": [[0.0, color], [1.0, color]],
+            "hovertemplate": f"<b>%{{text}}</b><br>Segmento: {label}<extra></extra>",
+        })
+
+    fig_cluster = figures.build(
+        "segments",
+        f"Segmentación de países (k = {len(cats)})",
+        traces,
+    )
+
+    items = []
+    for i, label in enumerate(cats, start=1):
+        n_in_segment = int(counts[label])
+        pct = round(100 * n_in_segment / total_countries, 1) if total_countries else 0
+
+        if i == 1:
+            desc = "baja intensidad"
+        elif i == len(cats):
+            desc = "alta intensidad"
+        else:
+            desc = "intensidad intermedia"
+        m = means.loc[label]
+        desc += (
+            f": media de {format_int(round(m['Model_Count']))} modelos, "
+            f"{m['Pollutant_Count']:.1f} contaminantes, {m['Process_Count']:.1f} procesos "
+            f"y {m['Year_Count']:.1f} años con datos."
         )
-        fig_cluster = style_fig(
-            fig_cluster,
-            f"Segmentación de países (k = {len(cats)})",
+
+        items.append(
+            html.Li(
+                f"{label}: {n_in_segment} países (~{pct}%) — {desc}",
+                style={"fontSize": "13px", "color": "#4b5563", "marginBottom": "4px"},
+            )
         )
-        fig_cluster.update_traces(
-            hovertemplate="<b>%{location}</b><br>Segmento: %{z}<extra></extra>"
+
+    explanation_children = [
+        html.H4(
+            "Interpretación de segmentos",
+            style={
+                "marginTop": "0",
+                "marginBottom": "6px",
+                "fontSize": "16px",
+                "color": "#111827",
+            },
+        ),
+        html.Ul(items),
+    ]
+    return fig_cluster, explanation_children
+
+
+# Construcción en paralelo: las figuras de una pestaña solo comparten la
+# selección del cubo, que es de solo lectura, así que se construyen a la vez
+# en un pool de hilos y la pestaña tarda lo que la figura más lenta en vez
+# de la suma. El pool es por proceso: un trabajo en segundo plano (fork)
+# crea el suyo.
+
+@lru_cache(maxsize=None)
+def container_cpus():
+    # Núcleos que puede usar el proceso: la cuota de CPU del cgroup (límite
+    # del contenedor) si la hay y, si no, su afinidad.
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cpus = os.cpu_count() or 1
+    try:
+        with open("/sys/fs/cgroup/cpu.max") as f:
+            quota, period = f.read().split()
+        if quota != "max":
+            cpus = min(cpus, max(1, -(-int(quota) // int(period))))
+    except (OSError, ValueError):
+        pass
+    return cpus
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _reset_pool():
+    # Los hilos del pool no sobreviven a un fork.
+    global _pool, _pool_lock
+    _pool = None
+    _pool_lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_reset_pool)
+
+
+def figure_pool():
+    # None con un solo núcleo: las figuras se construyen en serie.
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            workers = FIGURE_WORKERS or container_cpus()
+            if workers <= 1:
+                return None
+            _pool = ThreadPoolExecutor(workers, thread_name_prefix="figures")
+        return _pool
+
+
+def build_all(steps, set_progress=None):
+    # steps: [(nombre, función sin argumentos)]. Devuelve los resultados en
+    # el mismo orden e informa del avance según va terminando cada una. Con
+    # un perfil en curso (profiling.profiled) se construyen en serie en este
+    # hilo, el único que ve el perfilador.
+    pool = None if profiling.active() else figure_pool()
+    if pool is None:
+        results = []
+        for i, (name, build) in enumerate(steps):
+            report(set_progress, i, len(steps), f"Calculando {name}…")
+            results.append(build())
+        return results
+
+    # Cada tarea corre en una copia del contexto actual: dentro de una
+    # petición, sus tiempos (metrics.record) cuentan en ella.
+    futures = {
+        pool.submit(contextvars.copy_context().run, build): i
+        for i, (_, build) in enumerate(steps)
+    }
+    pending = [name for name, _ in steps]
+    results = [None] * len(steps)
+    report(set_progress, 0, len(steps), f"Calculando {', '.join(pending)}…")
+    for done, future in enumerate(as_completed(futures), 1):
+        i = futures[future]
+        results[i] = future.result()
+        pending.remove(steps[i][0])
+        if pending:
+            report(set_progress, done, len(steps), f"Calculando {', '.join(pending)}…")
+    return results
+
+
+# Vistas de cada pestaña a través de la caché compartida. Las usan los
+# callbacks y el precalentamiento (hot_views), así que comparten las claves.
+# set_progress, si se pasa, recibe el avance del cálculo (report).
+
+# Gráficos de la pestaña general que calcula el servidor; en modo cliente,
+# mapa, ranking y evolución los calcula el navegador.
+OVERVIEW_GRAPHS = (
+    ["fig-process"] if CLIENT_MODE
+    else ["fig-map", "fig-ranking", "fig-trend", "fig-process"]
+)
+# Los que recalcula también el modo en vivo del slider de años.
+LIVE_GRAPHS = ("fig-map", "fig-ranking", "fig-trend")
+
+
+def overview_key(state, pol_list, year_range, country):
+    section = "overview-client" if CLIENT_MODE else "overview"
+    return view_key(section, state.version, pol_list, year_range, country)
+
+
+def overview_figures(state, pol_list, year_range, country, set_progress=None):
+    def compute():
+        sel = select_cube(state, pol_list, year_range, country)
+        y0, y1 = int(year_range[0]), int(year_range[1])
+
+        steps = {
+            "fig-map": ("mapa", lambda: build_map(sel, state.country_codes)),
+            "fig-ranking": ("ranking", lambda: build_ranking(sel)),
+            "fig-trend": ("evolución", lambda: build_trend(sel, y0, y1)),
+            "fig-process": ("procesos", lambda: build_process(sel)),
+        }
+        return tuple(build_all([steps[g] for g in OVERVIEW_GRAPHS], set_progress))
+
+    return cache.get_or_compute(
+        overview_key(state, pol_list, year_range, country),
+        compute,
+        tag=state.version,
+    )
+
+
+def segment_model(state, pol_list, year_range, country):
+    # Perfil y k-means de todas las k, en la caché compartida con una clave
+    # sin k: cambiar k (en cualquier worker o trabajo en segundo plano) solo
+    # vuelve a pintar. El resultado no debe modificarse.
+    def compute():
+        sel = select_cube(state, pol_list, year_range, country)
+        return segment_solutions(sel, state.country_codes)
+
+    return cache.get_or_compute(
+        view_key("segments", state.version, pol_list, year_range, country),
+        compute,
+        tag=state.version,
+    )
+
+
+def segmentation_view(state, pol_list, year_range, country, k, set_progress=None):
+    def compute():
+        report(set_progress, 0, 2, "Calculando k-means…")
+        model = segment_model(state, pol_list, year_range, country)
+        report(set_progress, 1, 2, "Dibujando segmentos…")
+        return (*build_segmentation(model, k), build_elbow(model[1], k))
+
+    return cache.get_or_compute(
+        view_key("segmentation", state.version, pol_list, year_range, country, k),
+        compute,
+        tag=state.version,
+    )
+
+
+def treemap_figure(state, pol_list, year_range, country, set_progress=None):
+    def compute():
+        report(set_progress, 0, 1, "Calculando treemap…")
+        return build_treemap(select_cube(state, pol_list, year_range, country))
+
+    return cache.get_or_compute(
+        view_key("tree", state.version, pol_list, year_range, country),
+        compute,
+        tag=state.version,
+    )
+
+
+# Si la vista se puede servir sin cálculo pesado (ver callbacks): está en
+# la caché de resultados o, en la segmentación, ya están sus k-means y solo
+# falta pintar la k pedida.
+
+def overview_ready(state, pol_list, year_range, country):
+    return cache.contains(overview_key(state, pol_list, year_range, country))
+
+
+def segmentation_ready(state, pol_list, year_range, country, k):
+    return cache.contains(
+        view_key("segmentation", state.version, pol_list, year_range, country, k)
+    ) or cache.contains(
+        view_key("segments", state.version, pol_list, year_range, country)
+    )
+
+
+def treemap_ready(state, pol_list, year_range, country):
+    return cache.contains(view_key("tree", state.version, pol_list, year_range, country))
+
+
+def hot_views(state):
+    # Estados de filtros más visitados: la vista inicial del layout y, para
+    # cada contaminante (los de más filas primero), todo el rango de años en
+    # todos los países con cada k de la segmentación.
+    ALL = "Todos los países"
+    views = []
+
+    def add(name, pol_list, year_range, ks):
+        views.append((f"overview {name}", partial(overview_figures, state, pol_list, year_range, ALL)))
+        views.append((f"tree {name}", partial(treemap_figure, state, pol_list, year_range, ALL)))
+        for k in ks:
+            views.append((f"model {name} k={k}", partial(segmentation_view, state, pol_list, year_range, ALL, k)))
+
+    if not state.pollutants:
+        return views
+    add("inicial", [state.pollutants[0]], [max(state.ymin, state.ymax - 10), state.ymax], [3])
+
+    index = state.row_index
+    hot = sorted(
+        state.pollutants,
+        key=lambda p: -len(index.by_pollutant[index.pollutant_index[p]]),
+    )
+    if warmup.WARMUP_POLLUTANTS > 0:
+        hot = hot[:warmup.WARMUP_POLLUTANTS]
+    for p in hot:
+        add(p, [p], [state.ymin, state.ymax], SEGMENT_KS)
+    return views
+
+# ============================================================
+# 6. CALLBACKS
+# ============================================================
+#
+# Un callback por pestaña: cada uno recibe la pestaña activa y solo calcula
+# sus gráficos cuando está visible. Al cambiar de pestaña se dispara con los
+# filtros actuales, así que el contenido nunca queda desfasado al mostrarse.
+# Los resultados pasan por la caché compartida (cache.py) con clave canónica
+# y, si el navegador ya tiene la misma estructura de figura, solo se envían
+# los arrays de datos (figure_updates).
+#
+# Cada pestaña tiene dos callbacks. update_<pestaña> es un callback normal
+# que responde en la misma petición si la vista no necesita cálculo pesado
+# (pestaña oculta, filtros vacíos o resultado ya en la caché, como las
+# vistas precalentadas). Si no, escribe los filtros en el store
+# req-<pestaña>, que lanza compute_<pestaña>: un callback en segundo plano
+# (un proceso aparte) con barra de progreso. Un trabajo obsoleto no sigue
+# ocupando CPU: si llega otra petición de cálculo, el navegador la envía
+# indicando la anterior (oldJob), y si cambian los filtros se cancela
+# (FILTER_INPUTS). En ambos casos Dash termina su proceso.
+
+
+def server_callback(*args, **kwargs):
+    # app.callback para los callbacks que en modo cliente sustituye uno del
+    # navegador: en ese modo no se registran.
+    if CLIENT_MODE:
+        return lambda func: func
+    return app.callback(*args, **kwargs)
+
+
+@server_callback(
+    [
+        Output("kpi-models", "children"),
+        Output("kpi-countries", "children"),
+        Output("kpi-pollutants", "children"),
+    ],
+    [
+        Input("dd-pol", "value"),
+        Input("sl-year", "value"),
+        Input("dd-country", "value"),
+    ],
+)
+@metrics.callback
+@profiling.profiled
+def update_kpis(pol_list, year_range, country):
+    if not pol_list or year_range is None:
+        return "0", "0", "0"
+
+    return build_kpis(select_cube(datastore.current(), pol_list, year_range, country))
+
+
+# Filtros que invalidan un cálculo en curso: si cambian, Dash termina el
+# trabajo en segundo plano de la pestaña (cancel), también cuando la vista
+# nueva sale de la caché y no llega a lanzar otro.
+FILTER_INPUTS = [
+    Input("dd-pol", "value"),
+    Input("sl-year", "value"),
+    Input("dd-country", "value"),
+]
+
+
+def job_request(*filters):
+    # Valor del store req-<pestaña> que lanza su trabajo en segundo plano. El
+    # instante hace que repetir los mismos filtros vuelva a lanzarlo.
+    return {"filters": filters, "at": time.time()}
+
+
+def live_graphs(live):
+    # Gráficos que update_overview_live también reemplaza si el modo en vivo
+    # está activo (figure_updates los envía enteros).
+    return LIVE_GRAPHS if "live" in (live or []) else ()
+
+
+@app.callback(
+    [Output(graph, "figure") for graph in OVERVIEW_GRAPHS]
+    + [Output("sig-overview", "data"), Output("req-overview", "data")],
+    FILTER_INPUTS + [Input("tabs-main", "value"), Input("chk-live", "value")],
+    State("sig-overview", "data"),
+)
+@metrics.callback
+@profiling.profiled
+def update_overview(pol_list, year_range, country, tab, live, signatures):
+    if tab != "tab-overview":
+        raise PreventUpdate
+
+    n = len(OVERVIEW_GRAPHS)
+    if not pol_list or year_range is None:
+        return (*[figures.empty("Sin datos")] * n, {}, no_update)
+
+    state = datastore.current()
+    if not overview_ready(state, pol_list, year_range, country):
+        return (*[no_update] * n, no_update, job_request(pol_list, year_range, country))
+
+    figs = overview_figures(state, pol_list, year_range, country)
+    outputs, signatures = figure_updates(
+        dict(zip(OVERVIEW_GRAPHS, figs)), signatures, live_graphs(live)
+    )
+    return (*outputs, signatures, no_update)
+
+
+@app.callback(
+    [Output(graph, "figure", allow_duplicate=True) for graph in OVERVIEW_GRAPHS]
+    + [Output("sig-overview", "data", allow_duplicate=True)],
+    Input("req-overview", "data"),
+    [State("sig-overview", "data"), State("chk-live", "value")],
+    background=True,
+    interval=JOB_POLL_MS,
+    cancel=FILTER_INPUTS,
+    prevent_initial_call=True,
+    **job_outputs("overview"),
+)
+@metrics.callback
+@profiling.profiled
+def compute_overview(set_progress, request, signatures, live):
+    pol_list, year_range, country = request["filters"]
+    figs = overview_figures(
+        datastore.current(), pol_list, year_range, country, set_progress
+    )
+    outputs, signatures = figure_updates(
+        dict(zip(OVERVIEW_GRAPHS, figs)), signatures, live_graphs(live)
+    )
+    return (*outputs, signatures)
+
+
+@app.callback(
+    [
+        Output("fig-cluster", "figure"),
+        Output("txt-k-explanation", "children"),
+        Output("fig-elbow", "figure"),
+        Output("sig-model", "data"),
+        Output("req-model", "data"),
+    ],
+    FILTER_INPUTS + [Input("sl-k", "value"), Input("tabs-main", "value")],
+    State("sig-model", "data"),
+)
+@metrics.callback
+@profiling.profiled
+def update_segmentation(pol_list, year_range, country, k, tab, signatures):
+    if tab != "tab-model":
+        raise PreventUpdate
+
+    if not pol_list or year_range is None or k is None:
+        empty_fig = figures.empty("Sin datos")
+        return empty_fig, empty_explanation(), empty_fig, {}, no_update
+
+    state = datastore.current()
+    if not segmentation_ready(state, pol_list, year_range, country, k):
+        return (
+            no_update, no_update, no_update, no_update,
+            job_request(pol_list, year_range, country, k),
         )
 
-        items = []
-        for i, label in enumerate(cats, start=1):
-            n_in_segment = int(counts[label])
-            pct = round(100 * n_in_segment / total_countries, 1) if total_countries else 0
-
-            if i == 1:
-                desc = "baja intensidad: pocos modelos y poca diversidad."
-            elif i == len(cats):
-                desc = "alta intensidad: muchos modelos y alta diversidad."
-            else:
-                desc = "intensidad intermedia."
-
-            items.append(
-                html.Li(
-                    f"{label}: {n_in_segment} países (~{pct}%) — {desc}",
-                    style={"fontSize": "13px", "color": "#4b5563", "marginBottom": "4px"},
-                )
-            )
+    fig_cluster, explanation_children, fig_elbow = segmentation_view(
+        state, pol_list, year_range, country, k
+    )
+    (fig_cluster, fig_elbow), signatures = figure_updates(
+        {"fig-cluster": fig_cluster, "fig-elbow": fig_elbow}, signatures
+    )
+    return fig_cluster, explanation_children, fig_elbow, signatures, no_update
+
+
+@app.callback(
+    [
+        Output("fig-cluster", "figure", allow_duplicate=True),
+        Output("txt-k-explanation", "children", allow_duplicate=True),
+        Output("fig-elbow", "figure", allow_duplicate=True),
+        Output("sig-model", "data", allow_duplicate=True),
+    ],
+    Input("req-model", "data"),
+    State("sig-model", "data"),
+    background=True,
+    interval=JOB_POLL_MS,
+    cancel=FILTER_INPUTS + [Input("sl-k", "value")],
+    prevent_initial_call=True,
+    **job_outputs("model"),
+)
+@metrics.callback
+@profiling.profiled
+def compute_segmentation(set_progress, request, signatures):
+    pol_list, year_range, country, k = request["filters"]
+    fig_cluster, explanation_children, fig_elbow = segmentation_view(
+        datastore.current(), pol_list, year_range, country, k, set_progress
+    )
+    (fig_cluster, fig_elbow), signatures = figure_updates(
+        {"fig-cluster": fig_cluster, "fig-elbow": fig_elbow}, signatures
+    )
+    return fig_cluster, explanation_children, fig_elbow, signatures
+
+
+@app.callback(
+    [
+        Output("fig-treemap", "figure"),
+        Output("sig-tree", "data"),
+        Output("req-tree", "data"),
+    ],
+    FILTER_INPUTS + [Input("tabs-main", "value")],
+    State("sig-tree", "data"),
+)
+@metrics.callback
+@profiling.profiled
+def update_treemap(pol_list, year_range, country, tab, signatures):
+    if tab != "tab-tree":
+        raise PreventUpdate
+
+    if not pol_list or year_range is None:
+        return figures.empty("Sin datos"), {}, no_update
+
+    state = datastore.current()
+    if not treemap_ready(state, pol_list, year_range, country):
+        return no_update, no_update, job_request(pol_list, year_range, country)
 
-        explanation_children = [
-            html.H4(
-                "Interpretación de segmentos",
-                style={
-                    "marginTop": "0",
-                    "marginBottom": "6px",
-                    "fontSize": "16px",
-                    "color": "#111827",
-                },
-            ),
-            html.Ul(items),
-        ]
+    fig_treemap = treemap_figure(state, pol_list, year_range, country)
+    (fig_treemap,), signatures = figure_updates({"fig-treemap": fig_treemap}, signatures)
+    return fig_treemap, signatures, no_update
+
+
+@app.callback(
+    [
+        Output("fig-treemap", "figure", allow_duplicate=True),
+        Output("sig-tree", "data", allow_duplicate=True),
+    ],
+    Input("req-tree", "data"),
+    State("sig-tree", "data"),
+    background=True,
+    interval=JOB_POLL_MS,
+    cancel=FILTER_INPUTS,
+    prevent_initial_call=True,
+    **job_outputs("tree"),
+)
+@metrics.callback
+@profiling.profiled
+def compute_treemap(set_progress, request, signatures):
+    pol_list, year_range, country = request["filters"]
+    fig_treemap = treemap_figure(
+        datastore.current(), pol_list, year_range, country, set_progress
+    )
+    (fig_treemap,), signatures = figure_updates({"fig-treemap": fig_treemap}, signatures)
+    return fig_treemap, signatures
+
+# Modo en vivo: mientras se arrastra el slider de años (drag_value) se
+# recalculan mapa, ranking y evolución desde YearPrefix, sin pasar por la
+# caché. Al soltar, update_overview deja la vista completa y definitiva. Si
+# se agota LIVE_BUDGET_MS, los gráficos pendientes esperan a ese momento.
+#
+# Estos gráficos tienen entonces dos escritores que pueden solaparse (un
+# arrastre durante un trabajo en segundo plano), así que ninguno envía un
+# Patch calculado con firmas que el otro puede haber dejado obsoletas: aquí
+# siempre van enteros y, con el modo activo, también desde update_overview.
+
+@server_callback(
+    [
+        Output("fig-map", "figure", allow_duplicate=True),
+        Output("fig-ranking", "figure", allow_duplicate=True),
+        Output("fig-trend", "figure", allow_duplicate=True),
+    ],
+    Input("sl-year", "drag_value"),
+    [
+        State("chk-live", "value"),
+        State("dd-pol", "value"),
+        State("dd-country", "value"),
+        State("tabs-main", "value"),
+    ],
+    prevent_initial_call=True,
+)
+@metrics.callback
+@profiling.profiled
+def update_overview_live(year_range, live, pol_list, country, tab):
+    state = datastore.current()
+    if (
+        "live" not in (live or []) or tab != "tab-overview"
+        or not pol_list or not year_range or state.year_prefix is None
+    ):
+        raise PreventUpdate
+
+    start = time.perf_counter()
+    y0, y1 = int(year_range[0]), int(year_range[1])
+    sel = select_live(state, pol_list, y0, y1, country)
+
+    builders = [
+        lambda: build_map(sel, state.country_codes),
+        lambda: build_ranking(sel),
+        lambda: build_trend(sel, y0, y1),
+    ]
+    figs = []
+    for build in builders:
+        if (time.perf_counter() - start) * 1000 > LIVE_BUDGET_MS:
+            figs.append(no_update)
+        else:
+            figs.append(build())
+    return tuple(figs)
+
+# Modo cliente: KPIs, mapa, ranking y evolución se recalculan en el navegador
+# a partir de cube-store (assets/clientside.js), también mientras se arrastra
+# el slider de años. El store se envía con el layout y solo se vuelve a
+# pedir cuando cambia la versión del dataset.
+
+if CLIENT_MODE:
+    app.clientside_callback(
+        ClientsideFunction("eea", "kpis"),
+        [
+            Output("kpi-models", "children"),
+            Output("kpi-countries", "children"),
+            Output("kpi-pollutants", "children"),
+        ],
+        [
+            Input("dd-pol", "value"),
+            Input("sl-year", "value"),
+            Input("sl-year", "drag_value"),
+            Input("dd-country", "value"),
+            Input("cube-store", "data"),
+        ],
+    )
+
+    app.clientside_callback(
+        ClientsideFunction("eea", "overview"),
+        [
+            Output("fig-map", "figure"),
+            Output("fig-ranking", "figure"),
+            Output("fig-trend", "figure"),
+        ],
+        [
+            Input("dd-pol", "value"),
+            Input("sl-year", "value"),
+            Input("sl-year", "drag_value"),
+            Input("dd-country", "value"),
+            Input("tabs-main", "value"),
+            Input("cube-store", "data"),
+        ],
+    )
+
+    @app.callback(
+        Output("cube-store", "data"),
+        Input("data-version", "data"),
+        State("cube-store", "data"),
+        prevent_initial_call=True,
+    )
+    def refresh_store(version, store):
+        state = datastore.current()
+        if store and store["version"] == state.version:
+            raise PreventUpdate
+        return client_store(state)
+
+# Recarga en caliente: cuando datastore publica un dataset nuevo se vacían
+# las cachés que dependen de la versión anterior y se precalienta la nueva;
+# refresh_filters lleva las nuevas opciones de los filtros al navegador. Al
+# reasignar sl-year.value se vuelven a lanzar los callbacks de la pestaña
+# visible con los datos nuevos.
+
+@datastore.on_swap
+def on_reload(old, new):
+    cache.invalidate(old.version)
+    warmup.start()
+
+
+@app.callback(
+    [
+        Output("dd-pol", "options"),
+        Output("dd-country", "options"),
+        Output("sl-year", "min"),
+        Output("sl-year", "max"),
+        Output("sl-year", "marks"),
+        Output("sl-year", "value"),
+        Output("data-version", "data"),
+    ],
+    Input("data-poll", "n_intervals"),
+    [
+        State("data-version", "data"),
+        State("sl-year", "value"),
+    ],
+)
+def refresh_filters(_, version, year_range):
+    state = datastore.current()
+    if state.version == version:
+        raise PreventUpdate
+
+    y0, y1 = year_range or [state.ymin, state.ymax]
+    y0 = min(max(int(y0), state.ymin), state.ymax)
+    y1 = min(max(int(y1), y0), state.ymax)
 
     return (
-        format_int(n_models),
-        format_int(n_countries),
-        format_int(n_polls),
-        fig_map,
-        fig_rank,
-        fig_trend,
-        fig_proc,
-        fig_cluster,
-        fig_treemap,
-        explanation_children,
+        [{"label": p, "value": p} for p in state.pollutants],
+        [{"label": c, "value": c} for c in ["Todos los países"] + state.countries],
+        state.ymin,
+        state.ymax,
+        year_marks(state.ymin, state.ymax),
+        [y0, y1],
+        state.version,
     )
 
+
+datastore.watch()
+warmup.start(hot_views)
+
 # ============================================================
-# 6. EJECUCIÓN DEL SERVIDOR (RENDER)
+# 7. EJECUCIÓN DEL SERVIDOR (RENDER)
 # ============================================================
 if __name__ == "__main__":
     port = int(os.environ.get("PORT", 8050))
@@ -0,0 +1,263 @@
+// ============================
+// FILTRADO EN EL NAVEGADOR (CLIENT_MODE=1)
+// ============================
+//
+// Callbacks del navegador que sustituyen a update_kpis y a la parte de
+// update_overview que construye mapa, ranking y evolución (app.py). Trabajan
+// sobre cube-store (client_store): recuentos País × Contaminante × Año como
+// typed array, las etiquetas de cada eje, la plantilla y los esqueletos de
+// figures.py y el presupuesto de datos de las figuras. Cada función repite
+// la de app.py del mismo nombre, así que las figuras son las mismas que
+// construiría el servidor.
+
+(function () {
+    const ALL = "Todos los países";
+
+    const ARRAYS = {
+        i1: Int8Array, u1: Uint8Array,
+        i2: Int16Array, u2: Uint16Array,
+        i4: Int32Array, u4: Uint32Array,
+        f4: Float32Array, f8: Float64Array,
+    };
+
+    // Recuentos decodificados del último store: se decodifican una vez por
+    // versión del dataset, no en cada callback.
+    let decoded = {version: null, counts: null};
+
+    function counts(store) {
+        if (decoded.version !== store.version) {
+            const spec = store.counts;
+            let values = new Int32Array(0);
+            if (spec && spec.bdata) {
+                const bin = atob(spec.bdata);
+                const bytes = new Uint8Array(bin.length);
+                for (let i = 0; i < bin.length; i++) {
+                    bytes[i] = bin.charCodeAt(i);
+                }
+                values = new ARRAYS[spec.dtype](bytes.buffer);
+            }
+            decoded = {version: store.version, counts: values};
+        }
+        return decoded.counts;
+    }
+
+    // Rango de años: mientras se arrastra el slider, drag_value; en el resto
+    // de casos (soltar, otro filtro, recarga del dataset), value.
+    function yearRange(value, dragValue) {
+        const ctx = window.dash_clientside.callback_context;
+        const dragging = (ctx.triggered || []).some(
+            (t) => t.prop_id === "sl-year.drag_value"
+        );
+        return dragging && dragValue ? dragValue : value;
+    }
+
+    // Como CountCube.select + CubeSlice: totales por país, por contaminante
+    // y por (año, contaminante) del corte.
+    function select(store, polList, years, country) {
+        const cube = counts(store);
+        const nC = store.countries.length;
+        const nP = store.pollutants.length;
+        const nY = store.years.length;
+
+        const wanted = new Set(polList);
+        const pols = [];
+        store.pollutants.forEach((p, i) => {
+            if (wanted.has(p)) pols.push(i);
+        });
+
+        const first = nY ? store.years[0] : 0;
+        const i0 = Math.min(Math.max(Number(years[0]) - first, 0), nY);
+        const i1 = Math.min(Math.max(Number(years[1]) - first + 1, i0), nY);
+
+        let ctrs = [];
+        if (country === ALL) {
+            ctrs = store.countries.map((_, i) => i);
+        } else if (store.countries.indexOf(country) >= 0) {
+            ctrs = [store.countries.indexOf(country)];
+        }
+
+        const byCountry = new Float64Array(nC);
+        const byPollutant = new Float64Array(nP);
+        const byYearPollutant = new Float64Array(nY * nP);
+        for (const c of ctrs) {
+            for (const p of pols) {
+                const base = (c * nP + p) * nY;
+                for (let y = i0; y < i1; y++) {
+                    const v = cube[base + y];
+                    if (v) {
+                        byCountry[c] += v;
+                        byPollutant[p] += v;
+                        byYearPollutant[y * nP + p] += v;
+                    }
+                }
+            }
+        }
+        return {byCountry, byPollutant, byYearPollutant, i0, i1};
+    }
+
+    function formatInt(n) {
+        return String(Math.trunc(n)).replace(/\B(?=(\d{3})+(?!\d))/g, ".");
+    }
+
+    function build(store, kind, title, traces, layout) {
+        const skeleton = store.figures.skeletons[kind];
+        return {
+            data: traces.map((trace) => Object.assign({}, skeleton.trace, trace)),
+            layout: Object.assign(
+                {},
+                skeleton.layout,
+                {template: store.figures.template, title: {text: title}},
+                layout || {}
+            ),
+        };
+    }
+
+    function empty(store, title) {
+        return {data: [], layout: {template: store.figures.template, title: {text: title}}};
+    }
+
+    // Posiciones de los k mayores, de mayor a menor y con los empates por
+    // orden de posición (top_k).
+    function topK(values, k) {
+        return values
+            .map((_, i) => i)
+            .sort((a, b) => values[b] - values[a] || a - b)
+            .slice(0, Math.max(0, k));
+    }
+
+    // Países con datos en el orden del store (CubeSlice.by_country).
+    function byCountry(store, sel) {
+        const names = [], totals = [];
+        sel.byCountry.forEach((v, i) => {
+            if (v) {
+                names.push(store.countries[i]);
+                totals.push(v);
+            }
+        });
+        return {names, totals};
+    }
+
+    function buildMap(store, sel) {
+        const locations = [], text = [], z = [];
+        sel.byCountry.forEach((v, i) => {
+            if (v && store.codes[i]) {
+                locations.push(store.codes[i]);
+                text.push(store.countries[i]);
+                z.push(v);
+            }
+        });
+        if (!z.length) return empty(store, "Sin datos para mapa");
+
+        return build(store, "map", "Distribución europea de modelos", [{locations, text, z}]);
+    }
+
+    function buildRanking(store, sel) {
+        const geo = byCountry(store, sel);
+        const budget = store.budget;
+        const idx = topK(geo.totals, Math.min(budget.ranking, budget.points));
+        if (!idx.length) return empty(store, "Sin datos para ranking");
+
+        return build(store, "ranking", "Ranking de países por número de modelos", [{
+            x: idx.map((i) => geo.totals[i]),
+            y: idx.map((i) => geo.names[i]),
+        }]);
+    }
+
+    function buildTrend(store, sel, y0, y1) {
+        const nP = store.pollutants.length;
+
+        // Series por contaminante en orden de aparición, año a año
+        // (CubeSlice.by_year_pollutant + groupby(sort=False)).
+        const series = new Map();
+        const years = new Set();
+        for (let y = sel.i0; y < sel.i1; y++) {
+            for (let p = 0; p < nP; p++) {
+                const v = sel.byYearPollutant[y * nP + p];
+                if (!v) continue;
+                const pol = store.pollutants[p];
+                if (!series.has(pol)) series.set(pol, new Map());
+                series.get(pol).set(store.years[y], v);
+                years.add(y);
+            }
+        }
+        if (!series.size) return empty(store, "Sin datos para evolución");
+
+        // Como mucho budget.traces series (y budget.points puntos): los
+        // contaminantes con menos modelos se suman en una serie "Otros".
+        const budget = store.budget;
+        const n = Math.max(1, Math.min(budget.traces, Math.floor(budget.points / years.size)));
+        let order = [...series.keys()];
+        let others = null;
+        if (order.length > n) {
+            const totals = order.map((pol) => [...series.get(pol).values()].reduce((a, b) => a + b, 0));
+            const keep = new Set(topK(totals, n - 1).map((i) => order[i]));
+            others = new Map();
+            for (const pol of order) {
+                if (keep.has(pol)) continue;
+                for (const [year, v] of series.get(pol)) {
+                    others.set(year, (others.get(year) || 0) + v);
+                }
+            }
+            order = order.filter((pol) => keep.has(pol));
+        }
+
+        const colors = store.figures.colors;
+        const traces = order.map((pol) => [pol, series.get(pol)]);
+        if (others) traces.push(["Otros", others]);
+        return build(
+            store,
+            "trend",
+            "Evolución del número de modelos por año",
+            traces.map(([pol, values], i) => {
+                const x = [...values.keys()].sort((a, b) => a - b);
+                const color = pol === "Otros" ? store.figures.others : colors[i % colors.length];
+                return {
+                    name: pol,
+                    legendgroup: pol,
+                    line: {color, dash: "solid"},
+                    x,
+                    y: x.map((year) => values.get(year)),
+                };
+            }),
+            {xaxis: {title: {text: "Year"}, dtick: Math.max(1, Math.floor((y1 - y0) / 10) || 1)}}
+        );
+    }
+
+    window.dash_clientside = Object.assign({}, window.dash_clientside, {
+        eea: {
+            kpis: function (polList, value, dragValue, country, store) {
+                const years = yearRange(value, dragValue);
+                if (!store || !polList || !polList.length || !years) {
+                    return ["0", "0", "0"];
+                }
+
+                const sel = select(store, polList, years, country);
+                return [
+                    formatInt(sel.byCountry.reduce((a, b) => a + b, 0)),
+                    formatInt(sel.byCountry.filter((v) => v > 0).length),
+                    formatInt(sel.byPollutant.filter((v) => v > 0).length),
+                ];
+            },
+
+            overview: function (polList, value, dragValue, country, tab, store) {
+                if (tab !== "tab-overview" || !store) {
+                    throw window.dash_clientside.PreventUpdate;
+                }
+
+                const years = yearRange(value, dragValue);
+                if (!polList || !polList.length || !years) {
+                    const emptyFig = empty(store, "Sin datos");
+                    return [emptyFig, emptyFig, emptyFig];
+                }
+
+                const y0 = Number(years[0]), y1 = Number(years[1]);
+                const sel = select(store, polList, years, country);
+                return [
+                    buildMap(store, sel),
+                    buildRanking(store, sel),
+                    buildTrend(store, sel, y0, y1),
+                ];
+            },
+        },
+    });
+})();
@@ -0,0 +1,190 @@
+import argparse
+import json
+import os
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# ============================
+# BENCHMARK DEL DASHBOARD
+# ============================
+#
+# Para cada tamaño de dataset (múltiplos del extracto real, generados con
+# synthetic.py) se mide en un proceso aparte:
+#   - la carga: parseo y limpieza del CSV, snapshot, índice, cubo y el import
+#     completo de app.py;
+#   - cada sección de los callbacks (filtro, KPIs, mapa, ranking, evolución,
+#     procesos, treemap, k-means de k = 2..6, pintado de cada k y serialización) sobre
+#     combinaciones representativas de filtros, sin pasar por la caché;
+#   - el pico de memoria: RSS máximo del proceso y pico de asignaciones de
+#     Python (tracemalloc) por combinación.
+#
+#   python benchmarks/run.py --scales 10 100 1000 --json bench.json
+
+SECTIONS = ["filter", "kpis", "map", "ranking", "trend", "processes", "treemap"]
+K_VALUES = range(2, 7)
+
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    value = fn(*args)
+    return value, (time.perf_counter() - start) * 1000
+
+
+def peak_rss_mb():
+    # ru_maxrss está en KB en Linux.
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def combos(app):
+    # Uno o todos los contaminantes × rango estrecho o completo × un país o
+    # "Todos los países".
+    data = app.datastore.current().data
+    top_pollutant = data["Air Pollutant"].value_counts().index[0]
+    top_country = data["Country"].value_counts().index[0]
+    narrow = [max(app.ymin, app.ymax - 2), app.ymax]
+
+    for pol_name, pols in [("1 pol", [top_pollutant]), ("all pols", app.pollutants)]:
+        for year_name, years in [("narrow", narrow), ("full", [app.ymin, app.ymax])]:
+            for ctry_name, country in [("1 country", top_country), ("all", "Todos los países")]:
+                yield f"{pol_name} / {year_name} / {ctry_name}", pols, years, country
+
+
+def run_sections(app, pols, years, country):
+    from plotly.io.json import to_json_plotly
+
+    y0, y1 = int(years[0]), int(years[1])
+    ms = {}
+
+    state = app.datastore.current()
+    sel, ms["filter"] = timed(lambda: app.select_cube(state, pols, years, country))
+    _, ms["kpis"] = timed(lambda: app.build_kpis(sel))
+    figs = {}
+    figs["map"], ms["map"] = timed(lambda: app.build_map(sel, state.country_codes))
+    figs["ranking"], ms["ranking"] = timed(lambda: app.build_ranking(sel))
+    figs["trend"], ms["trend"] = timed(lambda: app.build_trend(sel, y0, y1))
+    figs["processes"], ms["processes"] = timed(lambda: app.build_process(sel))
+    figs["treemap"], ms["treemap"] = timed(lambda: app.build_treemap(sel))
+
+    # El k-means de todas las k se resuelve una vez por estado de filtros
+    # (seg solve); después cada k solo pinta.
+    model, ms["seg solve"] = timed(lambda: app.segment_solutions(sel, state.country_codes))
+    for k in K_VALUES:
+        (figs[f"k={k}"], _), ms[f"seg k={k}"] = timed(lambda: app.build_segmentation(model, k))
+
+    _, ms["serialization"] = timed(lambda: [to_json_plotly(f) for f in figs.values()])
+    return ms
+
+
+def worker(csv_path, repeat):
+    # Se ejecuta en un proceso nuevo por tamaño: el snapshot y la caché van a
+    # un directorio temporal para que cada medida parta de cero.
+    tmp = tempfile.mkdtemp(prefix="eea-bench-")
+    os.environ["DATA_FILE"] = csv_path
+    os.environ["SNAPSHOT_DIR"] = os.path.join(tmp, "snapshot")
+    os.environ["CACHE_DIR"] = os.path.join(tmp, "cache")
+    os.environ["WARMUP"] = "0"
+
+    from cube import CountCube, RowIndex, YearPrefix
+    from dataset import dataset_version, read_snapshot, read_sources, write_snapshot
+
+    # Los valores se pasan como argumentos (no en lambdas que los capturen)
+    # para que cada del los libere antes de la medida siguiente.
+    load = {}
+    data, load["read_csv"] = timed(read_sources, csv_path)
+    target, load["snapshot_write"] = timed(
+        write_snapshot, data, dataset_version(csv_path), os.environ["SNAPSHOT_DIR"]
+    )
+    del data
+    (data, _), load["snapshot_read"] = timed(read_snapshot, target)
+    index, load["row_index"] = timed(RowIndex, data)
+    cube, load["cube"] = timed(CountCube.from_index, index)
+    _, load["year_prefix"] = timed(YearPrefix, cube)
+    del data, index, cube
+
+    app, load["app_import"] = timed(__import__, "app")
+    rss_after_load = peak_rss_mb()
+
+    results = []
+    for name, pols, years, country in combos(app):
+        runs = [run_sections(app, pols, years, country) for _ in range(repeat)]
+        ms = {key: statistics.median(r[key] for r in runs) for key in runs[0]}
+
+        tracemalloc.start()
+        run_sections(app, pols, years, country)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        results.append({"combo": name, "ms": ms, "peak_alloc_mb": peak / 2**20})
+
+    return {
+        "csv": csv_path,
+        "rows": int(len(app.datastore.current().data)),
+        "load_ms": load,
+        "rss_after_load_mb": rss_after_load,
+        "peak_rss_mb": peak_rss_mb(),
+        "combos": results,
+    }
+
+
+def report(result):
+    print(f"\n== {result['csv']} ({result['rows']:,} filas) ==")
+    print("carga:  " + "  ".join(f"{k} {v:.0f}ms" for k, v in result["load_ms"].items()))
+    print(
+        f"memoria: RSS tras carga {result['rss_after_load_mb']:.0f} MB, "
+        f"pico {result['peak_rss_mb']:.0f} MB"
+    )
+
+    keys = list(result["combos"][0]["ms"])
+    header = f"{'combinación':34}" + "".join(f"{k:>14}" for k in keys) + f"{'peak MB':>10}"
+    print(header)
+    for row in result["combos"]:
+        cells = "".join(f"{row['ms'][k]:>12.2f}ms" for k in keys)
+        print(f"{row['combo']:34}{cells}{row['peak_alloc_mb']:>10.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark del dashboard EEA")
+    parser.add_argument("--scales", type=int, nargs="+", default=[10, 100, 1000])
+    parser.add_argument("--data-dir", default=os.path.join(ROOT, "benchmarks", "data"))
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--json", help="guarda los resultados en este fichero")
+    parser.add_argument("--worker", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        json.dump(worker(args.worker, args.repeat), sys.stdout)
+        return
+
+    from benchmarks.synthetic import generate
+
+    results = []
+    for scale in args.scales:
+        csv_path = os.path.join(args.data_dir, f"DataExtract_x{scale}.csv")
+        if not os.path.exists(csv_path):
+            print(f"Generando {csv_path}...", file=sys.stderr)
+            generate(csv_path, scale)
+
+        out = subprocess.run(
+            [sys.executable, os.path.abspath(__file__),
+             "--worker", csv_path, "--repeat", str(args.repeat)],
+            cwd=ROOT, check=True, capture_output=True, text=True,
+        )
+        result = {"scale": scale, **json.loads(out.stdout)}
+        report(result)
+        results.append(result)
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
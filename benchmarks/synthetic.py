@@ -0,0 +1,149 @@
+import argparse
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from dataset import COLS, read_sources
+
+# ============================
+# GENERADOR DE DATOS SINTÉTICOS
+# ============================
+#
+# Escribe un DataExtract.csv con el mismo esquema que el de la EEA (las 14
+# columnas que usa el dashboard más los identificadores de modelo) y
+# cardinalidades parecidas a las reales, multiplicando el tamaño del extracto
+# original. Se genera por bloques para que el 1000× no necesite tenerlo
+# entero en memoria.
+#
+#   python benchmarks/synthetic.py --scale 100 --out benchmarks/data/x100.csv
+
+# Extracto real cuyo tamaño (filas ya limpias, como las carga el dashboard)
+# se multiplica.
+REAL_FILE = os.path.join(ROOT, "DataExtract.csv")
+CHUNK_ROWS = 500_000
+
+COUNTRIES = [
+    "Germany", "France", "Italy", "Spain", "Poland", "Netherlands", "Belgium",
+    "Czechia", "Austria", "Sweden", "Portugal", "Greece", "Hungary", "Romania",
+    "Denmark", "Finland", "Slovakia", "Ireland", "Croatia", "Bulgaria",
+    "Slovenia", "Lithuania", "Latvia", "Estonia", "Luxembourg", "Cyprus",
+    "Malta", "Norway", "Switzerland", "Iceland",
+]
+
+POLLUTANTS = {
+    "PM10": "Particulate matter < 10 µm (aerosol)",
+    "PM2.5": "Particulate matter < 2.5 µm (aerosol)",
+    "NO2": "Nitrogen dioxide (air)",
+    "O3": "Ozone (air)",
+    "SO2": "Sulphur dioxide (air)",
+    "CO": "Carbon monoxide (air)",
+    "C6H6": "Benzene (air)",
+    "BaP in PM10": "Benzo(a)pyrene in PM10 (aerosol)",
+    "Pb in PM10": "Lead in PM10 (aerosol)",
+    "As in PM10": "Arsenic in PM10 (aerosol)",
+    "Cd in PM10": "Cadmium in PM10 (aerosol)",
+    "Ni in PM10": "Nickel in PM10 (aerosol)",
+    "NOX as NO2": "Nitrogen oxides (air)",
+}
+
+PROCESSES = [
+    "Annual mean / 1 calendar year",
+    "1 year day exceed 125",
+    "1 year hour exceed 350",
+    "1 year hour exceed 200",
+    "1 year day exceed 50",
+    "Maximum daily 8-hour mean",
+    "Days with maximum 8h mean > 120",
+    "AOT40c for vegetation, May to July",
+    "AOT40c for forest, April to September",
+    "Winter mean / 1 October - 31 March",
+    "Hourly mean / 1 hour",
+    "Daily mean / 1 day",
+    "Percentile 90.4 of daily means",
+    "Percentile 99.8 of hourly means",
+    "SOMO35",
+]
+
+YEARS = list(range(2013, 2024))
+
+CATEGORIES = {
+    "Spatial Resolution Description": ["1 km x 1 km", "2 km x 2 km", "4 km x 4 km", "10 km x 10 km", "Street level"],
+    "Temporal Resolution": ["hour", "day", "year"],
+    "Meteorology": ["Diagnostic", "Prognostic", "Observed"],
+    "Chemistry": ["Full chemistry", "Simplified chemistry", "No chemistry"],
+    "Emissions": ["National inventory", "Regional inventory", "Local inventory", "EMEP"],
+    "Topography": ["Included", "Not included"],
+    "Assessment Type": ["Objective estimation", "Modelling", "Modelling and fixed measurement"],
+    "Administration Level": ["National", "Regional", "Local"],
+    "Model Application": ["Assessment", "Forecast", "Source apportionment", "Planning"],
+}
+
+
+def _weights(n, skew):
+    # Distribución tipo Zipf: pocos valores concentran la mayoría de filas.
+    w = 1.0 / np.arange(1, n + 1) ** skew
+    return w / w.sum()
+
+
+def generate_chunk(rng, n, start):
+    country = rng.choice(COUNTRIES, n, p=_weights(len(COUNTRIES), 1.0))
+    pollutant = rng.choice(list(POLLUTANTS), n, p=_weights(len(POLLUTANTS), 0.8))
+    year = rng.choice(YEARS, n, p=_weights(len(YEARS), -0.5))
+
+    process = rng.choice(PROCESSES, n, p=_weights(len(PROCESSES), 1.2)).astype(object)
+    process[rng.random(n) < 0.01] = np.nan
+
+    ids = np.arange(start, start + n)
+    chunk = {
+        "Country": country,
+        "Year": year,
+        "AQ Model Id": [f"SYN.{i}" for i in ids],
+        "Model Process Id": [f"SYN.MOP.{i}" for i in ids],
+        "Air Pollutant": pollutant,
+        "Air Pollutant Description": [POLLUTANTS[p] for p in pollutant],
+        "Data Aggregation Process": process,
+    }
+    for col, values in CATEGORIES.items():
+        chunk[col] = rng.choice(values, n)
+
+    # Algunas filas sucias, como en el extracto real.
+    df = pd.DataFrame(chunk)
+    df.loc[rng.random(n) < 0.002, "Year"] = np.nan
+    df.loc[rng.random(n) < 0.001, "Air Pollutant"] = np.nan
+    return df[["AQ Model Id", "Model Process Id", *COLS]]
+
+
+def real_rows(path=REAL_FILE):
+    return len(read_sources(path))
+
+
+def generate(path, scale, seed=0):
+    rows = real_rows() * scale
+    rng = np.random.default_rng(seed)
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+    written = 0
+    while written < rows:
+        n = min(CHUNK_ROWS, rows - written)
+        generate_chunk(rng, n, written).to_csv(
+            path, mode="w" if written == 0 else "a", header=written == 0, index=False
+        )
+        written += n
+    return rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="DataExtract.csv sintético")
+    parser.add_argument("--scale", type=int, default=10, help="múltiplo del tamaño real")
+    parser.add_argument("--out", default=None)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    out = args.out or os.path.join("benchmarks", "data", f"DataExtract_x{args.scale}.csv")
+    rows = generate(out, args.scale, args.seed)
+    print(f"{out}: {rows} filas")
@@ -0,0 +1,179 @@
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import diskcache
+import psutil
+
+# ============================
+# CACHÉ DE RESULTADOS
+# ============================
+#
+# Los workers de gunicorn calculan los mismos gráficos para las mismas
+# combinaciones de filtros. Los resultados se guardan en una caché en disco
+# (SQLite vía diskcache) que comparten todos los procesos de la máquina, con
+# expulsión LRU, caducidad por TTL y un tamaño máximo. Cada entrada lleva
+# como etiqueta la versión del dataset con que se calculó, para poder
+# descartarlas todas cuando se recarga el dataset (invalidate).
+#
+# Cálculo único por clave (single-flight): si llegan a la vez varias
+# peticiones con la misma clave y no está en caché, solo una la calcula y el
+# resto espera su resultado. Dentro de un worker esperan a un Event del hilo
+# que calcula; entre workers, ese hilo toma además un cerrojo en diskcache
+# sobre la clave, así que el primer worker calcula y los demás leen lo que
+# deja en la caché. El cerrojo guarda el pid de su dueño: si ese proceso ya no
+# existe (un trabajo en segundo plano cancelado) se libera en el acto, y en
+# cualquier caso caduca a los FLIGHT_TIMEOUT segundos. Quien espera consulta
+# el cerrojo cada vez más espaciado (de LOCK_POLL_MIN a LOCK_POLL_MAX
+# segundos) y, pasado FLIGHT_TIMEOUT, calcula sin él.
+
+CACHE_DIR = os.environ.get(
+    "CACHE_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache"),
+)
+CACHE_TTL = int(os.environ.get("CACHE_TTL", 3600))
+CACHE_SIZE_MB = int(os.environ.get("CACHE_SIZE_MB", 128))
+FLIGHT_TIMEOUT = float(os.environ.get("FLIGHT_TIMEOUT", 30))
+LOCK_POLL_MIN = 0.001
+LOCK_POLL_MAX = 0.05
+
+_MISSING = object()
+
+# Resultados y progreso de los callbacks en segundo plano de Dash
+# (DiskcacheManager); cada entrada vive hasta que el navegador la recoge.
+jobs = diskcache.Cache(os.path.join(CACHE_DIR, "jobs"))
+
+results = diskcache.Cache(
+    os.path.join(CACHE_DIR, "results"),
+    size_limit=CACHE_SIZE_MB * 1024 * 1024,
+    eviction_policy="least-recently-used",
+    tag_index=True,
+)
+
+
+class _Flight:
+    """Cálculo en curso de una clave en este worker."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = _MISSING
+
+
+_flights = {}
+_flights_lock = threading.Lock()
+
+# SQLite no admite un fork con una transacción abierta en otro hilo: el hijo
+# hereda el estado de sus cerrojos y se queda esperando para siempre. Todo
+# acceso a results pasa por _db, que se toma también durante cada fork (los
+# trabajos en segundo plano de Dash son procesos hijos del worker).
+_db = threading.RLock()
+
+
+def _after_fork_in_child():
+    # El hijo hereda los cálculos en curso del padre, pero no los hilos que
+    # los terminarían.
+    global _flights, _flights_lock
+    _flights = {}
+    _flights_lock = threading.Lock()
+    _db.release()
+
+
+os.register_at_fork(
+    before=_db.acquire,
+    after_in_parent=_db.release,
+    after_in_child=_after_fork_in_child,
+)
+
+
+def _get(key):
+    with _db:
+        return results.get(key, default=_MISSING, retry=True)
+
+
+def _alive(pid):
+    try:
+        return psutil.Process(pid).status() != psutil.STATUS_ZOMBIE
+    except psutil.NoSuchProcess:
+        return False
+
+
+def _release(name, pid):
+    with _db, results.transact(retry=True):
+        if results.get(name, retry=True) == pid:
+            results.delete(name, retry=True)
+
+
+@contextmanager
+def _process_lock(name):
+    pid = os.getpid()
+    deadline = time.monotonic() + FLIGHT_TIMEOUT
+    delay = LOCK_POLL_MIN
+    held = False
+    while True:
+        with _db:
+            if results.add(name, pid, expire=FLIGHT_TIMEOUT, retry=True):
+                held = True
+                break
+        owner = _get(name)
+        if owner is not _MISSING and owner is not None and not _alive(owner):
+            _release(name, owner)
+            continue
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            break
+        time.sleep(min(delay, remaining))
+        delay = min(delay * 2, LOCK_POLL_MAX)
+    try:
+        yield
+    finally:
+        if held:
+            _release(name, pid)
+
+
+def _compute_once(key, compute, tag):
+    # Entre workers: quien obtiene el cerrojo vuelve a mirar la caché, porque
+    # otro worker puede haberla llenado mientras esperaba.
+    with _process_lock(("flight", key)):
+        value = _get(key)
+        if value is _MISSING:
+            value = compute()
+            with _db:
+                results.set(key, value, expire=CACHE_TTL or None, tag=tag, retry=True)
+    return value
+
+
+def contains(key):
+    with _db:
+        return key in results
+
+
+def get_or_compute(key, compute, tag=None):
+    value = _get(key)
+    if value is not _MISSING:
+        return value
+
+    with _flights_lock:
+        flight = _flights.get(key)
+        leader = flight is None
+        if leader:
+            flight = _flights[key] = _Flight()
+
+    if not leader:
+        # Si el cálculo del otro hilo falla o tarda demasiado, se calcula aquí.
+        if flight.done.wait(FLIGHT_TIMEOUT) and flight.value is not _MISSING:
+            return flight.value
+        return compute()
+
+    try:
+        flight.value = _compute_once(key, compute, tag)
+        return flight.value
+    finally:
+        with _flights_lock:
+            del _flights[key]
+        flight.done.set()
+
+
+def invalidate(tag):
+    with _db:
+        return results.evict(tag, retry=True)
@@ -0,0 +1,405 @@
+import numpy as np
+import pandas as pd
+
+# ============================
+# MOTOR DE AGREGACIÓN
+# ============================
+#
+# Todas las vistas del dashboard son recuentos de registros de modelos sobre
+# País × Contaminante × Año × Proceso de agregación. En lugar de filtrar las
+# filas en cada callback, se construye una única vez un cubo denso de
+# recuentos indexado por códigos enteros y cada gráfico suma cortes del cubo.
+
+DIMENSIONS = ["Country", "Air Pollutant", "Year", "Data Aggregation Process"]
+
+
+def dimension_labels(data):
+    # Etiquetas de las cuatro dimensiones, leídas de las columnas categóricas
+    # sin volver a factorizar las cadenas.
+    process = data["Data Aggregation Process"].array
+
+    # Los procesos nulos se conservan como categoría propia para que cuenten
+    # en el resto de vistas; by_country_process los descarta como groupby.
+    processes = list(process.categories)
+    if (process.codes < 0).any():
+        processes.append(np.nan)
+
+    # El eje de años es contiguo para que un rango de años sea un slice.
+    year_values = data["Year"].to_numpy()
+    y_first = int(year_values.min()) if len(year_values) else 0
+    y_last = int(year_values.max()) if len(year_values) else -1
+
+    return (
+        list(data["Country"].array.categories),
+        list(data["Air Pollutant"].array.categories),
+        range(y_first, y_last + 1),
+        processes,
+    )
+
+
+def dimension_codes(data):
+    labels = dimension_labels(data)
+    years, processes = labels[2], labels[3]
+
+    process_codes = data["Data Aggregation Process"].array.codes
+    if len(processes) and pd.isna(processes[-1]):
+        process_codes = np.where(process_codes < 0, len(processes) - 1, process_codes)
+
+    codes = (
+        data["Country"].array.codes,
+        data["Air Pollutant"].array.codes,
+        data["Year"].to_numpy() - years.start,
+        process_codes,
+    )
+    return labels, codes
+
+
+def count_codes(codes, shape):
+    flat = np.ravel_multi_index(codes, shape)
+    return (
+        np.bincount(flat, minlength=int(np.prod(shape)))
+        .astype(np.int32)
+        .reshape(shape)
+    )
+
+
+class _Dimensions:
+
+    def __init__(self, countries, pollutants, years, processes):
+        self.countries = list(countries)
+        self.pollutants = list(pollutants)
+        self.years = list(years)
+        self.processes = list(processes)
+
+        self.country_index = {c: i for i, c in enumerate(self.countries)}
+        self.pollutant_index = {p: i for i, p in enumerate(self.pollutants)}
+
+    def shape(self):
+        return (
+            len(self.countries), len(self.pollutants),
+            len(self.years), len(self.processes),
+        )
+
+    def _resolve(self, pol_list, y0, y1, country):
+        # Orden canónico (el del diccionario), independiente de la selección:
+        # la caché de resultados usa la lista de contaminantes ordenada.
+        pol_idx = sorted({
+            self.pollutant_index[p] for p in pol_list if p in self.pollutant_index
+        })
+
+        # Posiciones [i0, i1) en el eje de años, ambas dentro de
+        # [0, len(years)]: un rango fuera del dataset es un corte vacío.
+        n = len(self.years)
+        first = self.years[0] if n else 0
+        i0 = min(max(y0 - first, 0), n)
+        i1 = min(max(y1 - first + 1, i0), n)
+
+        if country is None:
+            ctry_idx = list(range(len(self.countries)))
+        elif country in self.country_index:
+            ctry_idx = [self.country_index[country]]
+        else:
+            ctry_idx = []
+
+        return pol_idx, i0, i1, ctry_idx
+
+    def _slice(self, pol_idx, i0, i1, ctry_idx, counts):
+        return CubeSlice(
+            [self.countries[i] for i in ctry_idx],
+            [self.pollutants[i] for i in pol_idx],
+            self.years[i0:i1],
+            self.processes,
+            counts,
+        )
+
+
+def _positions(source, target):
+    # Posición en target de cada etiqueta de source, eje por eje. Los
+    # procesos nulos (NaN) ocupan la última posición de ambos.
+    def lookup(labels, target_labels):
+        index = {v: i for i, v in enumerate(target_labels) if not pd.isna(v)}
+        nan_pos = len(target_labels) - 1
+        return [nan_pos if pd.isna(v) else index[v] for v in labels]
+
+    y_offset = target.years[0] - source.years[0] if source.years else 0
+    return (
+        lookup(source.countries, target.countries),
+        lookup(source.pollutants, target.pollutants),
+        [i - y_offset for i in range(len(source.years))],
+        lookup(source.processes, target.processes),
+    )
+
+
+class CountCube(_Dimensions):
+    """Cubo de recuentos con ejes (país, contaminante, año, proceso)."""
+
+    def __init__(self, countries, pollutants, years, processes, counts):
+        super().__init__(countries, pollutants, years, processes)
+        self.counts = counts
+
+    @classmethod
+    def from_index(cls, index):
+        return cls(
+            index.countries, index.pollutants, index.years, index.processes,
+            count_codes(index.codes, index.shape()),
+        )
+
+    def extend(self, index, rows):
+        # Cubo con las dimensiones de index (las del dataset ampliado, que
+        # contienen las actuales) sumando solo las filas nuevas: los recuentos
+        # existentes se copian a su posición y no se vuelven a contar.
+        counts = np.zeros(index.shape(), dtype=np.int32)
+        counts[np.ix_(*_positions(self, index))] = self.counts
+
+        if len(rows):
+            labels, codes = dimension_codes(rows)
+            new = _Dimensions(*labels)
+            lookup = _positions(new, index)
+            counts += count_codes(
+                tuple(np.asarray(pos, dtype=np.intp)[c] for pos, c in zip(lookup, codes)),
+                index.shape(),
+            )
+
+        return CountCube(index.countries, index.pollutants, index.years, index.processes, counts)
+
+    def select(self, pol_list, y0, y1, country=None):
+        pol_idx, i0, i1, ctry_idx = self._resolve(pol_list, y0, y1, country)
+        sub = self.counts[np.ix_(
+            ctry_idx, pol_idx, range(i0, i1), range(len(self.processes))
+        )]
+        return self._slice(pol_idx, i0, i1, ctry_idx, sub)
+
+
+# ============================
+# ÍNDICE DE SUMAS ACUMULADAS POR AÑO
+# ============================
+#
+# Para cada combinación (país, contaminante, proceso) se guarda la suma
+# acumulada a lo largo del eje de años, con un plano inicial de ceros. El
+# recuento de cualquier rango [y0, y1] es la resta de dos planos: O(1) por
+# celda, independiente de la anchura del rango. Lo usa el modo "en vivo" del
+# slider de años, que recalcula mientras se arrastra.
+
+class YearPrefix:
+
+    def __init__(self, cube, prefix=None, yearly=None):
+        self.cube = cube
+        if prefix is None:
+            counts = cube.counts
+            c, p, y, r = counts.shape
+
+            prefix = np.zeros((c, p, y + 1, r), dtype=np.int32)
+            np.cumsum(counts, axis=2, out=prefix[:, :, 1:, :])
+
+            # Serie anual sin el eje de procesos para la evolución temporal.
+            yearly = counts.sum(axis=3, dtype=np.int32)
+
+        self.prefix = prefix
+        self.yearly = yearly
+
+    def select(self, pol_list, y0, y1, country=None):
+        cube = self.cube
+        pol_idx, i0, i1, ctry_idx = cube._resolve(pol_list, y0, y1, country)
+        grid = np.ix_(ctry_idx, pol_idx)
+
+        totals = self.prefix[:, :, i1, :][grid] - self.prefix[:, :, i0, :][grid]
+        yearly = self.yearly[:, :, i0:i1][grid]
+
+        return RangeSlice(
+            [cube.countries[i] for i in ctry_idx],
+            [cube.pollutants[i] for i in pol_idx],
+            cube.years[i0:i1],
+            cube.processes,
+            totals[:, :, None, :],
+            yearly,
+        )
+
+
+# ============================
+# ÍNDICE DE FILAS
+# ============================
+#
+# Las filas están ordenadas por año, así que un rango de años es un slice que
+# se localiza por búsqueda binaria. Para cada país y cada contaminante se
+# guarda la lista ordenada de filas en que aparece (formato CSR: una sola
+# permutación más los límites de cada valor). Filtrar es recortar esas listas
+# al slice de años e intersecarlas, sin copiar el frame.
+#
+# Es además el motor de respaldo cuando el cubo denso no cabe en memoria
+# (CUBE_MAX_CELLS): select() agrega solo las filas filtradas.
+
+def _postings(codes, n):
+    order = np.argsort(codes, kind="stable").astype(np.int32)
+    bounds = np.searchsorted(codes[order], np.arange(n + 1))
+    return order, bounds
+
+
+def _split(order, bounds):
+    return [order[bounds[i]:bounds[i + 1]] for i in range(len(bounds) - 1)]
+
+
+def _clip(rows, lo, hi):
+    return rows[np.searchsorted(rows, lo):np.searchsorted(rows, hi)]
+
+
+class RowIndex(_Dimensions):
+    """Listas de filas por país y por contaminante sobre filas ordenadas por año."""
+
+    # Arrays que definen el índice; se pueden guardar junto al snapshot y
+    # volver a abrir con memory-map (ver arrays()).
+    ARRAYS = (
+        "country", "pollutant", "year", "process",
+        "country_order", "country_bounds", "pollutant_order", "pollutant_bounds",
+    )
+
+    def __init__(self, data, arrays=None):
+        if arrays is None:
+            labels, codes = dimension_codes(data)
+            arrays = dict(zip(self.ARRAYS[:4], codes))
+            arrays["country_order"], arrays["country_bounds"] = _postings(codes[0], len(labels[0]))
+            arrays["pollutant_order"], arrays["pollutant_bounds"] = _postings(codes[1], len(labels[1]))
+        else:
+            labels = dimension_labels(data)
+        super().__init__(*labels)
+
+        self.codes = tuple(arrays[name] for name in self.ARRAYS[:4])
+        self.year_values = data["Year"].to_numpy()
+        self.by_country = _split(arrays["country_order"], arrays["country_bounds"])
+        self.by_pollutant = _split(arrays["pollutant_order"], arrays["pollutant_bounds"])
+        self._arrays = arrays
+
+    def arrays(self):
+        return dict(self._arrays)
+
+    def cells(self):
+        return int(np.prod(self.shape()))
+
+    def rows(self, pol_list, y0, y1, country=None):
+        lo, hi = np.searchsorted(self.year_values, [y0, y1 + 1])
+        pol_idx, _, _, _ = self._resolve(pol_list, y0, y1, country)
+
+        parts = [_clip(self.by_pollutant[i], lo, hi) for i in pol_idx]
+        rows = np.sort(np.concatenate(parts)) if parts else np.empty(0, dtype=np.int32)
+
+        if country is not None:
+            if country not in self.country_index:
+                return rows[:0]
+            in_country = _clip(self.by_country[self.country_index[country]], lo, hi)
+            rows = np.intersect1d(rows, in_country, assume_unique=True)
+
+        return rows
+
+    def select(self, pol_list, y0, y1, country=None):
+        pol_idx, i0, i1, ctry_idx = self._resolve(pol_list, y0, y1, country)
+        rows = self.rows(pol_list, y0, y1, country)
+
+        # Códigos globales -> posiciones dentro del corte.
+        ctry_pos = np.full(len(self.countries), -1)
+        ctry_pos[ctry_idx] = np.arange(len(ctry_idx))
+        pol_pos = np.full(len(self.pollutants), -1)
+        pol_pos[pol_idx] = np.arange(len(pol_idx))
+
+        c, p, y, r = (codes[rows] for codes in self.codes)
+        shape = (len(ctry_idx), len(pol_idx), i1 - i0, len(self.processes))
+        sub = count_codes((ctry_pos[c], pol_pos[p], y - i0, r), shape)
+        return self._slice(pol_idx, i0, i1, ctry_idx, sub)
+
+
+class CubeSlice:
+    """Corte del cubo ya filtrado; cada método equivale a un groupby().size()."""
+
+    def __init__(self, countries, pollutants, years, processes, counts):
+        self.countries = countries
+        self.pollutants = pollutants
+        self.years = years
+        self.processes = processes
+        self.counts = counts
+
+    def total(self):
+        return int(self.counts.sum())
+
+    def country_totals(self):
+        return self.counts.sum(axis=(1, 2, 3))
+
+    def n_countries(self):
+        return int((self.country_totals() > 0).sum())
+
+    def n_pollutants(self):
+        return int((self.counts.sum(axis=(0, 2, 3)) > 0).sum())
+
+    def by_country(self, name="Model Count"):
+        totals = self.country_totals()
+        nz = np.flatnonzero(totals)
+        return pd.DataFrame({
+            "Country": [self.countries[i] for i in nz],
+            name: totals[nz],
+        })
+
+    def by_year_pollutant(self, name="Model Count"):
+        # (año, contaminante) en orden año-mayor, igual que groupby(["Year", ...]).
+        table = self.counts.sum(axis=(0, 3)).T
+        yi, pi = np.nonzero(table)
+        return pd.DataFrame({
+            "Year": np.asarray(self.years, dtype=int)[yi],
+            "Air Pollutant": [self.pollutants[i] for i in pi],
+            name: table[yi, pi],
+        })
+
+    def by_country_process(self, name="Count"):
+        table = self.counts.sum(axis=(1, 2))
+        table[:, pd.isna(self.processes)] = 0
+        ci, ri = np.nonzero(table)
+        return pd.DataFrame({
+            "Country": [self.countries[i] for i in ci],
+            "Data Aggregation Process": [self.processes[i] for i in ri],
+            name: table[ci, ri],
+        })
+
+    def by_pollutant_country(self, name="Count"):
+        table = self.counts.sum(axis=(2, 3)).T
+        pi, ci = np.nonzero(table)
+        return pd.DataFrame({
+            "Air Pollutant": [self.pollutants[i] for i in pi],
+            "Country": [self.countries[i] for i in ci],
+            name: table[pi, ci],
+        })
+
+    def _per_year(self):
+        return self.counts.sum(axis=(1, 3))
+
+    def country_profile(self):
+        # Por país con datos: nº de modelos y nº de contaminantes, procesos
+        # (sin contar los nulos) y años distintos con algún modelo.
+        per_pollutant = self.counts.sum(axis=(2, 3))
+        totals = per_pollutant.sum(axis=1)
+        nz = np.flatnonzero(totals)
+
+        known = [i for i, p in enumerate(self.processes) if not pd.isna(p)]
+        per_process = self.counts.sum(axis=(1, 2))[:, known]
+        return pd.DataFrame({
+            "Country": [self.countries[i] for i in nz],
+            "Model_Count": totals[nz],
+            "Pollutant_Count": (per_pollutant[nz] > 0).sum(axis=1),
+            "Process_Count": (per_process[nz] > 0).sum(axis=1),
+            "Year_Count": (self._per_year()[nz] > 0).sum(axis=1),
+        })
+
+
+class RangeSlice(CubeSlice):
+    """Corte con el eje de años ya sumado (un único tramo) desde YearPrefix."""
+
+    def __init__(self, countries, pollutants, years, processes, counts, yearly):
+        super().__init__(countries, pollutants, years, processes, counts)
+        self.yearly = yearly
+
+    def _per_year(self):
+        return self.yearly.sum(axis=1)
+
+    def by_year_pollutant(self, name="Model Count"):
+        table = self.yearly.sum(axis=0).T
+        yi, pi = np.nonzero(table)
+        return pd.DataFrame({
+            "Year": np.asarray(self.years, dtype=int)[yi],
+            "Air Pollutant": [self.pollutants[i] for i in pi],
+            name: table[yi, pi],
+        })
@@ -0,0 +1,467 @@
+import argparse
+import contextlib
+import csv
+import glob
+import hashlib
+import json
+import os
+import shutil
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+import numpy as np
+import pandas as pd
+
+# ============================
+# CARGA DEL DATASET
+# ============================
+#
+# El CSV de la EEA se limpia una sola vez y se guarda como snapshot columnar:
+# un directorio por versión del fichero de origen con un .npy por columna
+# (códigos enteros + diccionario para las columnas de texto, filas ordenadas
+# por año) y un meta.json con los valores derivados. Al arrancar, los workers abren el snapshot con
+# memory-map y solo vuelven a parsear el CSV si el snapshot está desfasado.
+#
+# El origen puede ser un único CSV, un directorio o un patrón glob con varios
+# extractos (por año o por país): se parsean en paralelo en un pool de
+# procesos, se unen y se eliminan los registros repetidos según DEDUP_KEY.
+# Las huellas de los ficheros (tamaño, mtime y hash de los últimos bytes)
+# permiten distinguir filas añadidas al final o extractos nuevos de un
+# cambio completo, y leer solo lo nuevo (detect_changes / append_rows).
+
+COLS = [
+    "Country", "Year", "Air Pollutant", "Air Pollutant Description",
+    "Data Aggregation Process", "Spatial Resolution Description",
+    "Temporal Resolution", "Meteorology", "Chemistry", "Emissions", "Topography",
+    "Assessment Type", "Administration Level", "Model Application"
+]
+
+TEXT_COLS = [c for c in COLS if c != "Year"]
+STRIP_COLS = ["Country", "Air Pollutant", "Data Aggregation Process"]
+
+CSV_CHUNK_ROWS = int(os.environ.get("CSV_CHUNK_ROWS", 200_000))
+
+# Columnas que identifican un registro de modelo (separadas por comas; vacío
+# desactiva la deduplicación) y nº de procesos para parsear varios extractos.
+DEDUP_KEY = [c.strip() for c in os.environ.get("DEDUP_KEY", "Model Process Id").split(",") if c.strip()]
+INGEST_WORKERS = int(os.environ.get("INGEST_WORKERS", os.cpu_count() or 1))
+KEY_COLUMN = "_key"
+
+SNAPSHOT_DIR = os.environ.get("SNAPSHOT_DIR", "snapshot")
+SNAPSHOT_FORMAT = 3
+TAIL_BYTES = 4096
+
+
+def resolve_sources(path):
+    # Un fichero, un directorio (todos sus .csv) o un patrón glob.
+    if os.path.isdir(path):
+        files = glob.glob(os.path.join(path, "*.csv"))
+    elif any(ch in path for ch in "*?["):
+        files = glob.glob(path)
+    else:
+        files = [path] if os.path.exists(path) else []
+    return sorted(files)
+
+
+def dataset_version(path, key=DEDUP_KEY):
+    # Huella barata del origen: cambia si se sustituye, amplía, añade o quita
+    # algún extracto, o si cambia la clave de deduplicación.
+    parts = [",".join(key)]
+    for source in resolve_sources(path):
+        st = os.stat(source)
+        parts.append(f"{os.path.abspath(source)}:{st.st_size}:{st.st_mtime_ns}")
+    return hashlib.sha1("\n".join(parts).encode()).hexdigest()[:12]
+
+
+def _tail_hash(path, size):
+    with open(path, "rb") as f:
+        f.seek(max(size - TAIL_BYTES, 0))
+        return hashlib.sha1(f.read(min(size, TAIL_BYTES))).hexdigest()
+
+
+def source_fingerprints(path):
+    sources = {}
+    for source in resolve_sources(path):
+        st = os.stat(source)
+        sources[os.path.abspath(source)] = {
+            "size": st.st_size,
+            "mtime_ns": st.st_mtime_ns,
+            "tail": _tail_hash(source, st.st_size),
+        }
+    return sources
+
+
+def _appended(source, old):
+    # El fichero solo ha crecido: los bytes que había siguen iguales y
+    # terminaban en fin de línea, así que lo nuevo empieza en una fila.
+    if os.path.getsize(source) <= old["size"] or _tail_hash(source, old["size"]) != old["tail"]:
+        return False
+    with open(source, "rb") as f:
+        f.seek(old["size"] - 1)
+        return f.read(1) == b"\n"
+
+
+def detect_changes(path, sources):
+    # Compara el origen con las huellas guardadas. Devuelve None si no ha
+    # cambiado, una lista de (fichero, offset) si solo hay filas añadidas al
+    # final o extractos nuevos (offset 0), o "full" si hay que releerlo todo.
+    # Sin ningún fichero de origen (despliegue solo con snapshot) no hay nada
+    # que recargar: se sigue con el snapshot.
+    current = resolve_sources(path)
+    if not current:
+        return None
+    if not sources:
+        return "full"
+
+    parts = []
+    for source in current:
+        old = sources.get(os.path.abspath(source))
+        if old is None:
+            parts.append((source, 0))
+            continue
+        st = os.stat(source)
+        if st.st_size == old["size"] and st.st_mtime_ns == old["mtime_ns"]:
+            continue
+        if not _appended(source, old):
+            return "full"
+        parts.append((source, old["size"]))
+
+    if set(sources) - {os.path.abspath(s) for s in current}:
+        return "full"
+    return parts or None
+
+
+@contextlib.contextmanager
+def _csv_from(path, offset):
+    # Desde offset (filas añadidas al final) se lee sin cabecera, con los
+    # nombres de columna de la primera línea del fichero.
+    if not offset:
+        yield path, {}
+        return
+    with open(path, "rb") as f:
+        names = next(csv.reader([f.readline().decode("utf-8-sig")]))
+        f.seek(offset)
+        yield f, {"header": None, "names": names}
+
+
+def read_csv_clean(path, key=(), chunksize=None, offset=0):
+    # Lectura por bloques: solo las columnas del dashboard, leídas como
+    # categóricas, y cada bloque se limpia y se pasa a códigos enteros antes
+    # de leer el siguiente. Nunca se tiene el CSV completo en memoria, solo
+    # los códigos de las filas válidas.
+    #
+    # Con key, se añade la columna KEY_COLUMN con un hash de 64 bits de esas
+    # columnas (0 si falta alguna) para deduplicar sin guardar los valores.
+    encoders = {c: CategoryEncoder() for c in TEXT_COLS}
+    codes = {c: [] for c in TEXT_COLS}
+    years = []
+    keys = []
+
+    # Las columnas del dashboard se leen como categóricas: el parser solo
+    # materializa cada valor distinto una vez por bloque. La clave, casi única
+    # por fila, se lee como texto y solo se usa para el hash.
+    wanted = set(COLS) | set(key)
+    with _csv_from(path, offset) as (source, options):
+        reader = pd.read_csv(
+            source,
+            usecols=lambda c: c in wanted,
+            dtype={c: ("category" if c in COLS else "str") for c in wanted},
+            chunksize=chunksize or CSV_CHUNK_ROWS,
+            **options,
+        )
+        for chunk in reader:
+            chunk_codes = {
+                c: encoders[c].encode(chunk[c].array, strip=c in STRIP_COLS)
+                for c in TEXT_COLS
+            }
+            year = chunk["Year"].array
+            year_lut = pd.to_numeric(year.categories, errors="coerce").to_numpy(dtype=float)
+            year = np.append(year_lut, np.nan)[year.codes]
+
+            keep = (
+                (chunk_codes["Country"] >= 0)
+                & (chunk_codes["Air Pollutant"] >= 0)
+                & ~np.isnan(year)
+            )
+            years.append(year[keep].astype(np.int32))
+            for c in TEXT_COLS:
+                codes[c].append(chunk_codes[c][keep])
+            if key:
+                keys.append(key_hashes(chunk, key)[keep])
+            del chunk, chunk_codes
+
+    year = np.concatenate(years) if years else np.empty(0, dtype=np.int32)
+    order = np.argsort(year, kind="stable")
+
+    columns = {}
+    for c in COLS:
+        if c == "Year":
+            columns[c] = year[order]
+        else:
+            merged = np.concatenate(codes.pop(c)) if years else np.empty(0, dtype=np.int32)
+            columns[c] = encoders[c].categorical(merged[order])
+    if key:
+        columns[KEY_COLUMN] = np.concatenate(keys)[order] if keys else np.empty(0, dtype=np.uint64)
+    return pd.DataFrame(columns)
+
+
+def key_hashes(chunk, key):
+    if not all(c in chunk for c in key):
+        return np.zeros(len(chunk), dtype=np.uint64)
+    values = chunk[list(key)]
+    hashes = pd.util.hash_pandas_object(values, index=False).to_numpy()
+    return np.where(values.isna().any(axis=1).to_numpy(), np.uint64(0), hashes)
+
+
+def merge_sources(frames):
+    # Une los extractos (diccionarios de categorías unificados), descarta los
+    # registros con clave repetida (se queda el primero) y deja las filas
+    # ordenadas por año como espera el resto de la app.
+    if len(frames) == 1:
+        data = frames[0]
+    else:
+        columns = {}
+        for c in frames[0].columns:
+            if c in TEXT_COLS:
+                columns[c] = pd.api.types.union_categoricals(
+                    [f[c] for f in frames], sort_categories=True
+                )
+            else:
+                columns[c] = np.concatenate([f[c].to_numpy() for f in frames])
+        data = pd.DataFrame(columns)
+
+    if KEY_COLUMN in data:
+        keys = data[KEY_COLUMN].to_numpy()
+        duplicated = pd.Series(keys).duplicated().to_numpy() & (keys != 0)
+        if duplicated.any():
+            data = data[~duplicated]
+
+    if len(frames) > 1 or len(data) < len(frames[0]):
+        data = data.sort_values("Year", kind="stable").reset_index(drop=True)
+        for c in TEXT_COLS:
+            data[c] = data[c].cat.remove_unused_categories()
+    return data
+
+
+def _read_part(part, key):
+    path, offset = part
+    return read_csv_clean(path, key=key, offset=offset)
+
+
+def read_parts(parts, key=DEDUP_KEY):
+    # Parsea cada (fichero, offset) en un proceso del pool (uno por núcleo
+    # como máximo) y los une. Con una sola parte no se crea el pool.
+    read = partial(_read_part, key=tuple(key))
+    workers = min(len(parts), INGEST_WORKERS)
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            frames = list(pool.map(read, parts))
+    else:
+        frames = [read(p) for p in parts]
+
+    return merge_sources(frames)
+
+
+def read_sources(path, key=DEDUP_KEY):
+    files = resolve_sources(path)
+    if not files:
+        raise FileNotFoundError(path)
+    return read_parts([(f, 0) for f in files], key)
+
+
+def append_rows(data, new):
+    # Añade a data las filas nuevas cuya clave no estaba ya. Devuelve el
+    # dataset unido y las filas que se han añadido de verdad.
+    if KEY_COLUMN in data and KEY_COLUMN in new:
+        keys = new[KEY_COLUMN].to_numpy()
+        fresh = (keys == 0) | ~np.isin(keys, data[KEY_COLUMN].to_numpy())
+        new = new[fresh].reset_index(drop=True)
+    return merge_sources([data, new]), new
+
+
+class CategoryEncoder:
+    """Diccionario incremental valor -> código para una columna de texto."""
+
+    def __init__(self):
+        self.index = {}
+
+    def encode(self, values, strip=False):
+        # values: Categorical del bloque. Basta con traducir sus categorías
+        # (pocas) al diccionario global; los nulos quedan como -1.
+        categories = values.categories
+        if strip:
+            categories = categories.astype(str).str.strip()
+        lut = np.fromiter(
+            (self.index.setdefault(v, len(self.index)) for v in categories),
+            dtype=np.int32,
+            count=len(categories),
+        )
+        return np.append(lut, -1)[values.codes]
+
+    def categorical(self, codes):
+        # Categorías ordenadas y solo las que aparecen en filas válidas, como
+        # astype("category") sobre la columna limpia.
+        values = np.array(list(self.index), dtype=object)
+        used = np.flatnonzero(np.bincount(codes[codes >= 0], minlength=len(values)))
+        used = used[np.argsort(values[used], kind="stable")]
+
+        remap = np.full(len(values) + 1, -1, dtype=np.int32)
+        remap[used] = np.arange(len(used))
+        categories = pd.Index(values[used].tolist(), dtype="str")
+        return pd.Categorical.from_codes(remap[codes], categories=categories)
+
+
+def build_meta(data, version, sources):
+    return {"version": version, "rows": len(data), "sources": sources, **derive(data)}
+
+
+def derive(data):
+    return {
+        "pollutants": sorted(data["Air Pollutant"].dropna().unique().tolist()),
+        "countries": sorted(data["Country"].dropna().unique().tolist()),
+        "ymin": int(data["Year"].min()),
+        "ymax": int(data["Year"].max()),
+    }
+
+
+# ----------------------------
+# Snapshot columnar
+# ----------------------------
+
+def write_snapshot(data, version, root=SNAPSHOT_DIR, sources=None):
+    # Se escribe en un directorio temporal y se publica con un rename, así un
+    # worker nunca lee un snapshot a medias.
+    target = os.path.join(root, version)
+    tmp = f"{target}.tmp-{os.getpid()}"
+    os.makedirs(tmp, exist_ok=True)
+
+    columns = {}
+    for i, c in enumerate(COLS):
+        name = f"{i:02d}.npy"
+        if c == "Year":
+            np.save(os.path.join(tmp, name), data[c].to_numpy(dtype=np.int32))
+            columns[c] = {"file": name}
+        else:
+            cat = data[c].array
+            np.save(os.path.join(tmp, name), cat.codes)
+            columns[c] = {"file": name, "categories": cat.categories.tolist()}
+
+    if KEY_COLUMN in data:
+        np.save(os.path.join(tmp, "key.npy"), data[KEY_COLUMN].to_numpy(dtype=np.uint64))
+        columns[KEY_COLUMN] = {"file": "key.npy"}
+
+    meta = {
+        "format": SNAPSHOT_FORMAT,
+        "columns": columns,
+        **build_meta(data, version, sources or {}),
+    }
+    with open(os.path.join(tmp, "meta.json"), "w", encoding="utf-8") as f:
+        json.dump(meta, f, ensure_ascii=False)
+
+    try:
+        os.rename(tmp, target)
+    except OSError:
+        # Otro proceso ya publicó esta misma versión.
+        shutil.rmtree(tmp, ignore_errors=True)
+
+    for entry in os.listdir(root):
+        if entry != version and ".tmp-" not in entry:
+            shutil.rmtree(os.path.join(root, entry), ignore_errors=True)
+
+    return target
+
+
+def read_snapshot(path):
+    with open(os.path.join(path, "meta.json"), encoding="utf-8") as f:
+        meta = json.load(f)
+    if meta.get("format") != SNAPSHOT_FORMAT:
+        return None, None
+
+    columns = {}
+    for c in COLS + [KEY_COLUMN]:
+        spec = meta["columns"].get(c)
+        if spec is None:
+            continue
+        values = np.load(os.path.join(path, spec["file"]), mmap_mode="r")
+        if "categories" in spec:
+            values = pd.Categorical.from_codes(values, categories=spec["categories"])
+        columns[c] = values
+
+    return pd.DataFrame(columns, copy=False), meta
+
+
+def write_arrays(path, arrays):
+    # Arrays derivados (índices, cubo) junto al snapshot, uno por .npy, para
+    # que los workers los abran con memory-map en vez de recalcularlos.
+    tmp = f"{path}.tmp-{os.getpid()}"
+    os.makedirs(tmp, exist_ok=True)
+    for name, values in arrays.items():
+        np.save(os.path.join(tmp, f"{name}.npy"), np.ascontiguousarray(values))
+    try:
+        os.rename(tmp, path)
+    except OSError:
+        shutil.rmtree(tmp, ignore_errors=True)
+    return path
+
+
+def read_arrays(path):
+    # Solo lectura: las páginas son las de la caché del sistema de ficheros y
+    # las comparten todos los procesos que abren el mismo snapshot.
+    return {
+        name[:-4]: np.load(os.path.join(path, name), mmap_mode="r")
+        for name in os.listdir(path) if name.endswith(".npy")
+    }
+
+
+def latest_snapshot(root=SNAPSHOT_DIR):
+    if not os.path.isdir(root):
+        return None
+    versions = [
+        os.path.join(root, v) for v in os.listdir(root)
+        if os.path.isfile(os.path.join(root, v, "meta.json"))
+    ]
+    return max(versions, key=os.path.getmtime) if versions else None
+
+
+def load_dataset(csv_path, root=SNAPSHOT_DIR):
+    # Devuelve (data, meta). meta incluye pollutants, countries, ymin, ymax,
+    # la versión del origen, que es la que usa la caché de resultados, y las
+    # huellas de los ficheros para detectar cambios (detect_changes).
+    if resolve_sources(csv_path):
+        version = dataset_version(csv_path)
+        path = os.path.join(root, version)
+    else:
+        # Despliegue solo con snapshot: se usa el más reciente disponible.
+        version, path = None, latest_snapshot(root)
+
+    if path and os.path.isfile(os.path.join(path, "meta.json")):
+        data, meta = read_snapshot(path)
+        if data is not None:
+            return data, meta
+
+    sources = source_fingerprints(csv_path)
+    data = read_sources(csv_path)
+    try:
+        write_snapshot(data, version, root, sources)
+    except OSError:
+        pass
+
+    return data, build_meta(data, version, sources)
+
+
+# ============================
+# PASO DE BUILD
+# ============================
+# python dataset.py build [DataExtract.csv | directorio | "extractos/*.csv"]
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Snapshot columnar del dataset EEA")
+    parser.add_argument("command", choices=["build"])
+    parser.add_argument("csv", nargs="?", default="DataExtract.csv")
+    parser.add_argument("--out", default=SNAPSHOT_DIR)
+    args = parser.parse_args()
+
+    sources = source_fingerprints(args.csv)
+    data = read_sources(args.csv)
+    target = write_snapshot(data, dataset_version(args.csv), args.out, sources)
+    print(f"Snapshot {target}: {len(data)} filas")
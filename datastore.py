@@ -0,0 +1,233 @@
+import logging
+import os
+import threading
+
+import geometry
+from cube import CountCube, RowIndex, YearPrefix
+from dataset import (
+    SNAPSHOT_DIR, append_rows, build_meta, dataset_version, detect_changes,
+    load_dataset, read_arrays, read_parts, read_snapshot, read_sources,
+    source_fingerprints, write_arrays, write_snapshot,
+)
+
+# ============================
+# ESTADO DEL DATASET Y RECARGA EN CALIENTE
+# ============================
+#
+# Todo lo que se deriva del dataset (índice de filas, cubo, sumas por año,
+# listas de filtros y versión) vive en un DatasetState inmutable. Los
+# callbacks leen current() una vez al empezar y trabajan con ese objeto, así
+# que una recarga a mitad de una petición no la deja a medias: el nuevo
+# estado se publica reasignando una única referencia.
+#
+# Un hilo vigila el origen cada RELOAD_INTERVAL segundos. Si solo hay filas
+# añadidas al final o extractos nuevos, se parsea solo lo nuevo y el cubo se
+# amplía con esas filas; si otro worker ya publicó el snapshot de la nueva
+# versión se carga ese; si el cambio es de otro tipo se relee todo.
+#
+# Memoria compartida entre workers: los arrays del índice, el cubo y las
+# sumas por año se guardan en <snapshot>/index y cada estado se abre con
+# memory-map de solo lectura, igual que las columnas del snapshot. Todos los
+# workers de gunicorn mapean los mismos ficheros, así que sus páginas están
+# una sola vez en la caché del sistema en vez de una copia por worker. Con
+# preload_app (gunicorn.conf.py) el master los mapea antes del fork.
+
+log = logging.getLogger(__name__)
+
+# Si el cubo denso superase CUBE_MAX_CELLS celdas se agrega desde el índice.
+CUBE_MAX_CELLS = int(os.environ.get("CUBE_MAX_CELLS", 10_000_000))
+RELOAD_INTERVAL = float(os.environ.get("RELOAD_INTERVAL", 30))
+
+
+class DatasetState:
+    """Dataset limpio, sus índices y los valores derivados para los filtros."""
+
+    def __init__(self, data, meta, row_index=None, cube=None, arrays=None):
+        # arrays: los de arrays() ya calculados (p. ej. abiertos con mmap);
+        # lo que no esté en él se calcula a partir de data.
+        self.data = data
+        self.meta = meta
+        self.version = meta["version"]
+
+        self.pollutants = meta["pollutants"]
+        self.countries = meta["countries"]
+        self.ymin, self.ymax = meta["ymin"], meta["ymax"]
+        # Código ISO-3 de cada país para los mapas.
+        self.country_codes = geometry.country_codes(self.countries)
+
+        # Índice de filas por país/contaminante sobre las filas ordenadas por
+        # año y cubo de recuentos País × Contaminante × Año × Proceso.
+        if row_index is None:
+            row_index = RowIndex(data, arrays)
+        self.row_index = row_index
+        if cube is None and arrays is not None and "cube" in arrays:
+            cube = CountCube(
+                row_index.countries, row_index.pollutants,
+                row_index.years, row_index.processes, arrays["cube"],
+            )
+        elif cube is None and row_index.cells() <= CUBE_MAX_CELLS:
+            cube = CountCube.from_index(row_index)
+        self.cube = cube
+
+        # Sumas acumuladas por año para el modo en vivo del slider de años.
+        if cube is None:
+            self.year_prefix = None
+        elif arrays is not None and "prefix" in arrays:
+            self.year_prefix = YearPrefix(cube, arrays["prefix"], arrays["yearly"])
+        else:
+            self.year_prefix = YearPrefix(cube)
+
+    def arrays(self):
+        arrays = self.row_index.arrays()
+        if self.cube is not None:
+            arrays["cube"] = self.cube.counts
+            arrays["prefix"] = self.year_prefix.prefix
+            arrays["yearly"] = self.year_prefix.yearly
+        return arrays
+
+    def select(self, pol_list, y0, y1, country=None):
+        return (self.cube or self.row_index).select(pol_list, y0, y1, country)
+
+    def extend(self, data, rows, meta):
+        # Estado con las filas nuevas ya unidas en data: el índice de filas se
+        # reconstruye (las filas cambian de posición al ordenarse por año) y
+        # el cubo se amplía sumando solo rows.
+        row_index = RowIndex(data)
+        cube = None
+        if self.cube is not None and row_index.cells() <= CUBE_MAX_CELLS:
+            cube = self.cube.extend(row_index, rows)
+        return DatasetState(data, meta, row_index=row_index, cube=cube)
+
+
+_state = None
+_path = None
+_lock = threading.Lock()
+_listeners = []
+
+
+def current():
+    return _state
+
+
+def _from_snapshot(version):
+    # Estado de una versión ya publicada con su índice, todo con mmap.
+    snapshot = os.path.join(SNAPSHOT_DIR, version)
+    index = os.path.join(snapshot, "index")
+    if not os.path.isfile(os.path.join(snapshot, "meta.json")) or not os.path.isdir(index):
+        return None
+    data, meta = read_snapshot(snapshot)
+    if data is None:
+        return None
+    return DatasetState(data, meta, arrays=read_arrays(index))
+
+
+def _share(state):
+    # Guarda los arrays de state junto a su snapshot y lo reabre desde disco
+    # para que la memoria sea la compartida. Sin snapshot (disco de solo
+    # lectura, p. ej.) se sigue con el estado en memoria del proceso.
+    if state.version is None:
+        return state
+    snapshot = os.path.join(SNAPSHOT_DIR, state.version)
+    if not os.path.isfile(os.path.join(snapshot, "meta.json")):
+        return state
+    try:
+        index = os.path.join(snapshot, "index")
+        if not os.path.isdir(index):
+            write_arrays(index, state.arrays())
+        return _from_snapshot(state.version) or state
+    except OSError:
+        return state
+
+
+def load(path):
+    global _state, _path
+    data, meta = load_dataset(path)
+    _path = path
+    state = _from_snapshot(meta["version"]) if meta["version"] else None
+    _state = state or _share(DatasetState(data, meta))
+    return _state
+
+
+def on_swap(listener):
+    # listener(old, new) se llama tras publicar un estado nuevo.
+    _listeners.append(listener)
+    return listener
+
+
+def refresh():
+    # Comprueba el origen y, si ha cambiado, publica el nuevo estado.
+    # Devuelve True si hubo recarga.
+    global _state
+    with _lock:
+        old = _state
+        if old is None:
+            return False
+        changes = detect_changes(_path, old.meta.get("sources"))
+        if changes is None:
+            return False
+
+        sources = source_fingerprints(_path)
+        version = dataset_version(_path)
+        snapshot = os.path.join(SNAPSHOT_DIR, version)
+
+        # Otro worker ya publicó esta versión: se mapea la suya.
+        new = _from_snapshot(version)
+        if new is None:
+            if changes == "full":
+                data = read_sources(_path)
+                new = DatasetState(data, build_meta(data, version, sources))
+            else:
+                data, rows = append_rows(old.data, read_parts(changes))
+                new = old.extend(data, rows, build_meta(data, version, sources))
+                log.info("Dataset %s: %d filas nuevas", version, len(rows))
+
+            if not os.path.isdir(snapshot):
+                try:
+                    write_snapshot(data, version, SNAPSHOT_DIR, sources)
+                except OSError:
+                    pass
+            new = _share(new)
+
+        _state = new
+
+    for listener in _listeners:
+        listener(old, new)
+    return True
+
+
+class Watcher(threading.Thread):
+
+    def __init__(self, interval):
+        super().__init__(daemon=True, name="dataset-watcher")
+        self.interval = interval
+        self.done = threading.Event()
+
+    def run(self):
+        while not self.done.wait(self.interval):
+            try:
+                refresh()
+            except Exception:
+                # Un extracto a medio escribir no debe tumbar el watcher: se
+                # reintenta en la siguiente vuelta con el estado anterior.
+                log.exception("Error recargando el dataset")
+
+
+_watcher = None
+
+
+def watch(interval=RELOAD_INTERVAL):
+    global _watcher
+    if interval > 0 and (_watcher is None or not _watcher.is_alive()):
+        _watcher = Watcher(interval)
+        _watcher.start()
+    return _watcher
+
+
+def stop_watching():
+    # Los hilos no sobreviven a un fork: el master de gunicorn lo para antes
+    # de crear los workers y cada worker arranca el suyo (gunicorn.conf.py).
+    global _watcher
+    if _watcher is not None:
+        _watcher.done.set()
+        _watcher.join()
+        _watcher = None
@@ -0,0 +1,207 @@
+import base64
+
+import numpy as np
+import plotly.graph_objects as go
+import plotly.io as pio
+from plotly.colors import make_colorscale, qualitative, sequential
+
+# ============================
+# FACTORÍA DE FIGURAS
+# ============================
+#
+# El estilo del dashboard se registra una vez como plantilla de Plotly y cada
+# tipo de gráfico tiene un esqueleto ya construido (traza prototipo + layout
+# fijo). Construir una figura es clonar el esqueleto y rellenar los arrays de
+# datos: no se pasa por plotly.express ni por la validación de go.Figure.
+#
+# Los arrays numéricos (NumPy) se envían como typed arrays de plotly.js:
+# {"dtype", "bdata"} con los bytes en base64, que el navegador convierte
+# directamente en un Float64Array/Int32Array... en vez de parsear un número
+# de texto por elemento. El JSON lo escribe plotly.io con orjson.
+
+FONT_FAMILY = "Segoe UI, system-ui, -apple-system, sans-serif"
+
+pio.templates["eea"] = go.layout.Template(
+    layout=dict(
+        paper_bgcolor="rgba(0,0,0,0)",
+        plot_bgcolor="rgba(0,0,0,0)",
+        margin=dict(l=40, r=20, t=70, b=40),
+        font=dict(
+            family=FONT_FAMILY,
+            size=12,
+            color="#212529",
+        ),
+        title_font=dict(
+            size=18,
+            family=FONT_FAMILY,
+        ),
+        legend=dict(
+            orientation="h",
+            yanchor="bottom",
+            y=-0.25,
+            xanchor="left",
+            x=0,
+        ),
+        hoverlabel=dict(
+            bgcolor="white",
+            bordercolor="#9ca3af",
+            font_size=12,
+            font_family=FONT_FAMILY,
+        ),
+    )
+)
+pio.templates.default = "plotly_white+eea"
+
+# Plantilla ya resuelta: las figuras se devuelven como dict y el navegador
+# necesita el objeto completo, no el nombre.
+TEMPLATE = pio.templates[pio.templates.default].to_plotly_json()
+
+COLORS = qualitative.Plotly
+SEGMENT_COLORS = qualitative.Set3
+
+SKELETONS = {
+    "map": {
+        "trace": {
+            "type": "choropleth",
+            "geo": "geo",
+            "coloraxis": "coloraxis",
+            "locationmode": "ISO-3",
+            "name": "",
+            "hovertemplate": "<b>%{text}</b><br>Modelos: %{z}<extra></extra>",
+        },
+        "layout": {
+            "geo": {"domain": {"x": [0.0, 1.0], "y": [0.0, 1.0]}, "scope": "europe"},
+            "coloraxis": {
+                "colorbar": {"title": {"text": "Modelos"}},
+                "colorscale": make_colorscale(sequential.YlGnBu),
+            },
+            "legend": {"tracegroupgap": 0},
+        },
+    },
+    "segments": {
+        "trace": {
+            "type": "choropleth",
+            "geo": "geo",
+            "locationmode": "ISO-3",
+            "showlegend": True,
+            "showscale": False,
+        },
+        "layout": {
+            "geo": {"domain": {"x": [0.0, 1.0], "y": [0.0, 1.0]}, "scope": "europe"},
+            "legend": {"title": {"text": "Segment"}, "tracegroupgap": 0},
+        },
+    },
+    "ranking": {
+        "trace": {
+            "type": "bar",
+            "orientation": "h",
+            "name": "",
+            "showlegend": False,
+            "marker": {"color": COLORS[0]},
+            "hovertemplate": "<b>%{y}</b><br>Modelos: %{x}<extra></extra>",
+        },
+        "layout": {
+            "xaxis": {"title": {"text": "Model Count"}},
+            "yaxis": {"title": {"text": "Country"}, "categoryorder": "total ascending"},
+            "barmode": "relative",
+        },
+    },
+    "trend": {
+        "trace": {
+            "type": "scatter",
+            "mode": "lines+markers",
+            "marker": {"symbol": "circle"},
+            "showlegend": True,
+            "hovertemplate": "<b>Año %{x}</b><br>Modelos: %{y}<extra></extra>",
+        },
+        "layout": {
+            "xaxis": {"title": {"text": "Year"}},
+            "yaxis": {"title": {"text": "Model Count"}},
+            "legend": {"title": {"text": "Air Pollutant"}, "tracegroupgap": 0},
+            "hovermode": "x unified",
+        },
+    },
+    "process": {
+        "trace": {
+            "type": "bar",
+            "orientation": "h",
+            "showlegend": True,
+            "hovertemplate": "<b>%{y}</b><br>Proceso: %{legendgroup}<br>Modelos: %{x}<extra></extra>",
+        },
+        "layout": {
+            "xaxis": {"title": {"text": "Número de modelos"}},
+            "yaxis": {"title": {"text": "País"}, "categoryorder": "total ascending"},
+            "legend": {"title": {"text": "Proceso"}, "tracegroupgap": 0},
+            "margin": {"l": 80, "r": 230, "t": 70, "b": 40},
+            "barmode": "stack",
+        },
+    },
+    "elbow": {
+        "trace": {
+            "type": "scatter",
+            "mode": "lines+markers",
+            "name": "",
+            "showlegend": False,
+            "line": {"color": COLORS[0]},
+            "hovertemplate": "<b>k = %{x}</b><br>Inercia: %{y:.3f}<extra></extra>",
+        },
+        "layout": {
+            "xaxis": {"title": {"text": "Nº de segmentos (k)"}, "dtick": 1},
+            "yaxis": {"title": {"text": "Inercia"}, "rangemode": "tozero"},
+        },
+    },
+    "treemap": {
+        "trace": {
+            "type": "treemap",
+            "branchvalues": "total",
+            "hovertemplate": "<b>%{label}</b><br>Modelos: %{value}<extra></extra>",
+        },
+        "layout": {"legend": {"tracegroupgap": 0}},
+    },
+}
+
+
+def typed(values):
+    # ndarray numérico -> typed array de plotly.js; lo demás no cambia. Los
+    # enteros van con el tipo más pequeño que los contiene (plotly.js no
+    # admite int64).
+    if not isinstance(values, np.ndarray) or values.dtype.kind not in "iuf" or not values.size:
+        return values
+
+    if values.dtype.kind == "f":
+        dtype = "f4" if values.dtype.itemsize == 4 else "f8"
+    else:
+        lo, hi = values.min(), values.max()
+        dtype = next(
+            (t for t in ("i1", "i2", "i4") if np.iinfo(t).min <= lo and hi <= np.iinfo(t).max),
+            "f8",
+        )
+
+    spec = {
+        "dtype": dtype,
+        "bdata": base64.b64encode(np.ascontiguousarray(values, dtype="<" + dtype)).decode("ascii"),
+    }
+    if values.ndim > 1:
+        spec["shape"] = ",".join(map(str, values.shape))
+    return spec
+
+
+def build(kind, title, traces, **layout):
+    # Clona el esqueleto: cada traza parte del prototipo y recibe sus datos.
+    skeleton = SKELETONS[kind]
+    return {
+        "data": [
+            {**skeleton["trace"], **{key: typed(v) for key, v in trace.items()}}
+            for trace in traces
+        ],
+        "layout": {
+            **skeleton["layout"],
+            "template": TEMPLATE,
+            "title": {"text": title},
+            **layout,
+        },
+    }
+
+
+def empty(title):
+    return {"data": [], "layout": {"template": TEMPLATE, "title": {"text": title}}}
@@ -0,0 +1,210 @@
+import json
+import os
+import struct
+import sys
+
+import numpy as np
+
+# ============================
+# GEOMETRÍA DE EUROPA PARA LOS MAPAS
+# ============================
+#
+# Genera europe_110m.json, el topojson que plotly.js pide para los mapas con
+# scope="europe" (geometry.py lo sirve y GRAPH_CONFIG apunta a él con
+# topojsonURL). Sigue la estructura de los ficheros que plotly.js descarga
+# de su CDN: objetos countries (id = código ISO-3), land, coastlines y los
+# vacíos ocean, lakes, rivers y subunits.
+#
+# Parte del shapefile de países 1:110m de Natural Earth (dominio público):
+#
+#   python geodata/build_topojson.py ne_110m_admin_0_countries.shp
+#
+# Solo se guardan los países con algún vértice en la zona visible del
+# scope Europa. Las costas son los tramos de borde que no comparte ningún otro
+# país. Las coordenadas se cuantizan (QUANTIZATION) y se guardan en deltas.
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+OUTPUT = os.path.join(HERE, "europe_110m.json")
+
+# Zona visible del scope Europa de plotly.js (lon -30..60, lat 30..85) con
+# margen para que los países del borde no queden cortados.
+LON_RANGE = (-40.0, 70.0)
+LAT_RANGE = (20.0, 90.0)
+QUANTIZATION = 10_000
+
+
+def read_dbf(path):
+    # Registros del .dbf como diccionarios con los nombres de campo en mayúsculas.
+    with open(path, "rb") as f:
+        data = f.read()
+    n, header_len, record_len = struct.unpack("<IHH", data[4:12])
+
+    fields = []
+    pos = 32
+    while data[pos] != 0x0D:
+        name = data[pos:pos + 11].split(b"\0")[0].decode("ascii").upper()
+        fields.append((name, data[pos + 16]))
+        pos += 32
+
+    records = []
+    for i in range(n):
+        start = header_len + i * record_len + 1
+        record = {}
+        for name, length in fields:
+            record[name] = data[start:start + length].decode("latin-1").strip()
+            start += length
+        records.append(record)
+    return records
+
+
+def read_shp(path):
+    # Anillos (arrays n × 2) de cada registro de polígonos del .shp.
+    with open(path, "rb") as f:
+        data = f.read()
+
+    shapes = []
+    pos = 100
+    while pos < len(data):
+        length = struct.unpack(">i", data[pos + 4:pos + 8])[0] * 2
+        content = data[pos + 8:pos + 8 + length]
+        pos += 8 + length
+
+        if struct.unpack("<i", content[:4])[0] != 5:
+            shapes.append([])
+            continue
+        n_parts, n_points = struct.unpack("<ii", content[36:44])
+        parts = list(struct.unpack(f"<{n_parts}i", content[44:44 + 4 * n_parts])) + [n_points]
+        points = np.frombuffer(
+            content, dtype="<f8", count=2 * n_points, offset=44 + 4 * n_parts
+        ).reshape(-1, 2)
+        shapes.append([points[parts[i]:parts[i + 1]] for i in range(n_parts)])
+    return shapes
+
+
+def is_clockwise(ring):
+    x, y = ring[:, 0], ring[:, 1]
+    return np.sum((x[1:] - x[:-1]) * (y[1:] + y[:-1])) > 0
+
+
+def polygons(rings):
+    # En el shapefile los anillos exteriores van en sentido horario y los
+    # huecos al revés (el mismo convenio que d3/plotly.js): cada anillo
+    # horario abre un polígono y los demás son huecos del anterior.
+    out = []
+    for ring in rings:
+        if is_clockwise(ring) or not out:
+            out.append([ring])
+        else:
+            out[-1].append(ring)
+    return out
+
+
+def country_code(record):
+    # Como geopandas: si no hay ISO_A3 (Francia, Noruega...) se usa ADM0_A3.
+    code = record.get("ISO_A3", "-99")
+    if code == "-99" and record.get("ADM0_A3"):
+        code = record["ADM0_A3"]
+    return code
+
+
+def visible(rings):
+    points = np.concatenate(rings)
+    return bool((
+        (points[:, 0] >= LON_RANGE[0]) & (points[:, 0] <= LON_RANGE[1])
+        & (points[:, 1] >= LAT_RANGE[0]) & (points[:, 1] <= LAT_RANGE[1])
+    ).any())
+
+
+def build(shp_path):
+    records = read_dbf(os.path.splitext(shp_path)[0] + ".dbf")
+    shapes = read_shp(shp_path)
+
+    # Cada tramo (par de puntos consecutivos) que aparece en un solo anillo
+    # de todo el mundo es costa; los compartidos son fronteras.
+    def segment_keys(ring):
+        a, b = ring[:-1], ring[1:]
+        return [tuple(sorted((tuple(p), tuple(q)))) for p, q in zip(a.tolist(), b.tolist())]
+
+    uses = {}
+    for rings in shapes:
+        for ring in rings:
+            for key in segment_keys(ring):
+                uses[key] = uses.get(key, 0) + 1
+
+    arcs = []
+
+    def add_arc(points):
+        arcs.append(points)
+        return len(arcs) - 1
+
+    countries, coastlines = [], []
+    for record, rings in zip(records, shapes):
+        if not rings or not visible(rings):
+            continue
+
+        geometry = [[[add_arc(ring)] for ring in polygon] for polygon in polygons(rings)]
+        if len(geometry) == 1:
+            countries.append({"type": "Polygon", "arcs": geometry[0], "id": country_code(record)})
+        else:
+            countries.append({"type": "MultiPolygon", "arcs": geometry, "id": country_code(record)})
+
+        # Tramos seguidos de costa de cada anillo como una línea.
+        for ring in rings:
+            coast = [uses[key] == 1 for key in segment_keys(ring)]
+            if all(coast):
+                coastlines.append([add_arc(ring)])
+                continue
+            # Se empieza justo después de un tramo de frontera para no
+            # partir en dos una costa que cruza el inicio del anillo.
+            start = coast.index(False) + 1
+            order = [(start + i) % len(coast) for i in range(len(coast))]
+            run = []
+            for i in order + [None]:
+                if i is not None and coast[i]:
+                    run.append(i)
+                elif run:
+                    points = np.concatenate([ring[run], ring[run[-1] + 1:run[-1] + 2]])
+                    coastlines.append([add_arc(points)])
+                    run = []
+
+    # Cuantización y deltas, como topojson -q.
+    points = np.concatenate(arcs)
+    lo = points.min(axis=0)
+    scale = (points.max(axis=0) - lo) / (QUANTIZATION - 1)
+    encoded = []
+    for arc in arcs:
+        q = np.round((arc - lo) / scale).astype(np.int64)
+        q = q[np.r_[True, (np.diff(q, axis=0) != 0).any(axis=1)]]
+        if len(q) < 2:
+            q = np.repeat(q[:1], 2, axis=0)
+        encoded.append(np.diff(q, axis=0, prepend=[[0, 0]]).tolist())
+
+    def collection(geometries):
+        return {"type": "GeometryCollection", "geometries": geometries}
+
+    land = [{k: v for k, v in g.items() if k != "id"} for g in countries]
+    coast = [{"type": "LineString", "arcs": arc} for arc in coastlines]
+    return {
+        "type": "Topology",
+        "transform": {"scale": scale.tolist(), "translate": lo.tolist()},
+        "objects": {
+            "countries": collection(countries),
+            "land": collection(land),
+            "coastlines": collection(coast),
+            "ocean": collection([]),
+            "lakes": collection([]),
+            "rivers": collection([]),
+            "subunits": collection([]),
+        },
+        "arcs": encoded,
+    }
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 2:
+        sys.exit("uso: python geodata/build_topojson.py ne_110m_admin_0_countries.shp")
+    topology = build(sys.argv[1])
+    with open(OUTPUT, "w", encoding="utf-8") as f:
+        json.dump(topology, f, separators=(",", ":"))
+    print(f"{OUTPUT}: {len(topology['objects']['countries']['geometries'])} países, "
+          f"{len(topology['arcs'])} arcos, {os.path.getsize(OUTPUT)} bytes")
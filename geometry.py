@@ -0,0 +1,118 @@
+import hashlib
+import logging
+import os
+
+from flask import Response, abort
+
+# ============================
+# GEOMETRÍA DE LOS MAPAS
+# ============================
+#
+# Los mapas (scope Europa) no descargan la geometría del CDN de plotly.js:
+# la app sirve geodata/europe_110m.json, un topojson solo de Europa y ya
+# simplificado (geodata/build_topojson.py), y GRAPH_CONFIG apunta a él con
+# topojsonURL. Así funcionan también sin acceso a internet. La URL lleva un
+# hash del contenido, de modo que el navegador lo guarda como inmutable y un
+# fichero regenerado cambia de URL.
+#
+# Los países se identifican por su código ISO-3, que es el id de cada país
+# en el topojson. Los nombres del dataset se traducen una vez al cargarlo
+# (DatasetState.country_codes), así que plotly.js ya no tiene que
+# reconocerlos con expresiones regulares en cada render.
+
+GEO_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "geodata")
+GEO_MAX_AGE = 365 * 24 * 3600
+
+log = logging.getLogger(__name__)
+
+# Nombres de país del dataset -> ISO-3.
+ISO3 = {
+    "Albania": "ALB",
+    "Andorra": "AND",
+    "Austria": "AUT",
+    "Belarus": "BLR",
+    "Belgium": "BEL",
+    "Bosnia and Herzegovina": "BIH",
+    "Bulgaria": "BGR",
+    "Croatia": "HRV",
+    "Cyprus": "CYP",
+    "Czechia": "CZE",
+    "Czech Republic": "CZE",
+    "Denmark": "DNK",
+    "Estonia": "EST",
+    "Finland": "FIN",
+    "France": "FRA",
+    "Germany": "DEU",
+    "Greece": "GRC",
+    "Hungary": "HUN",
+    "Iceland": "ISL",
+    "Ireland": "IRL",
+    "Italy": "ITA",
+    "Kosovo": "XKX",
+    "Latvia": "LVA",
+    "Liechtenstein": "LIE",
+    "Lithuania": "LTU",
+    "Luxembourg": "LUX",
+    "Malta": "MLT",
+    "Moldova": "MDA",
+    "Monaco": "MCO",
+    "Montenegro": "MNE",
+    "Netherlands": "NLD",
+    "North Macedonia": "MKD",
+    "Norway": "NOR",
+    "Poland": "POL",
+    "Portugal": "PRT",
+    "Romania": "ROU",
+    "Russia": "RUS",
+    "San Marino": "SMR",
+    "Serbia": "SRB",
+    "Slovakia": "SVK",
+    "Slovenia": "SVN",
+    "Spain": "ESP",
+    "Sweden": "SWE",
+    "Switzerland": "CHE",
+    "Türkiye": "TUR",
+    "Turkey": "TUR",
+    "Ukraine": "UKR",
+    "United Kingdom": "GBR",
+}
+
+
+def country_codes(countries):
+    # {nombre: ISO-3} de los países del dataset; los que no están en ISO3 no
+    # se pueden pintar en el mapa.
+    codes = {c: ISO3[c] for c in countries if c in ISO3}
+    unknown = [c for c in countries if c not in ISO3]
+    if unknown:
+        log.warning("Países sin código ISO-3 (no aparecerán en los mapas): %s", unknown)
+    return codes
+
+
+def _load():
+    # Ficheros de geodata/ en memoria (se sirven comprimidos con el resto de
+    # respuestas) y hash de su contenido para la URL.
+    files = {}
+    digest = hashlib.sha1()
+    for name in sorted(os.listdir(GEO_DIR)):
+        if name.endswith(".json"):
+            with open(os.path.join(GEO_DIR, name), "rb") as f:
+                files[name] = f.read()
+            digest.update(name.encode())
+            digest.update(files[name])
+    return files, digest.hexdigest()[:12]
+
+
+_files, VERSION = _load()
+TOPOJSON_URL = f"/geo/{VERSION}/"
+
+
+def _serve(version, name):
+    if version != VERSION or name not in _files:
+        abort(404)
+    response = Response(_files[name], mimetype="application/json")
+    response.headers["Cache-Control"] = f"public, max-age={GEO_MAX_AGE}, immutable"
+    return response
+
+
+def register(server):
+    server.add_url_rule("/geo/<version>/<name>", "geo", _serve)
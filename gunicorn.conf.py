@@ -0,0 +1,40 @@
+import gc
+import os
+
+# ============================
+# CONFIGURACIÓN DE GUNICORN
+# ============================
+#
+# gunicorn lee este fichero automáticamente (gunicorn app:server). Con
+# preload_app el master importa app.py una sola vez: carga el snapshot y
+# mapea los arrays del índice y del cubo antes de crear los workers, que los
+# heredan por copy-on-write en vez de cargar cada uno su copia. Como son
+# mmaps de solo lectura de ficheros del snapshot, las páginas siguen siendo
+# compartidas también tras una recarga en caliente (datastore.py).
+#
+# El número de workers sale de WEB_CONCURRENCY, que gunicorn ya respeta.
+
+preload_app = os.environ.get("PRELOAD_APP", "1") == "1"
+
+
+def pre_fork(server, worker):
+    import datastore
+    import warmup
+
+    # Los hilos que vigilan el origen y precalientan la caché no pasan al
+    # hijo; cada worker arranca los suyos en post_fork.
+    datastore.stop_watching()
+    warmup.stop()
+
+    # Los objetos del master pasan a la generación permanente: el recolector
+    # de los workers no los recorre, así que no escribe en sus páginas y no
+    # rompe el copy-on-write.
+    gc.freeze()
+
+
+def post_fork(server, worker):
+    import datastore
+    import warmup
+
+    datastore.watch()
+    warmup.start()
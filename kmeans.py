@@ -0,0 +1,101 @@
+import os
+
+import numpy as np
+
+# ============================
+# K-MEANS VECTORIZADO
+# ============================
+#
+# k-means (Lloyd) con inicialización k-means++ escrito con NumPy y resuelto
+# por lotes: todas las k pedidas y todos sus reinicios (KMEANS_N_INIT) se
+# ejecutan a la vez como un único tensor de centros (ejecuciones × kmax ×
+# variables). Las ejecuciones con k < kmax enmascaran los centros sobrantes
+# con distancia infinita, así que cada iteración es una sola operación sobre
+# el lote. De cada k se queda el reinicio con menor inercia.
+#
+# La semilla es fija: el mismo estado de filtros da siempre los mismos
+# segmentos, en cualquier worker y tras leerlos de la caché.
+
+KMEANS_N_INIT = int(os.environ.get("KMEANS_N_INIT", 10))
+KMEANS_MAX_ITER = int(os.environ.get("KMEANS_MAX_ITER", 100))
+KMEANS_SEED = int(os.environ.get("KMEANS_SEED", 0))
+
+
+class Solution:
+    """Mejor agrupación para un k: etiqueta por fila, centros e inercia."""
+
+    def __init__(self, labels, centers, inertia):
+        self.labels = labels
+        self.centers = centers
+        self.inertia = inertia
+
+
+def _distances(X, centers, valid):
+    # Distancia euclídea al cuadrado de cada punto a cada centro: (B, n, kmax).
+    d = ((X[None, :, None, :] - centers[:, None, :, :]) ** 2).sum(axis=3)
+    d[~np.broadcast_to(valid[:, None, :], d.shape)] = np.inf
+    return d
+
+
+def _init_centers(X, kk, kmax, rng):
+    # k-means++ por lotes: cada nuevo centro se elige con probabilidad
+    # proporcional a la distancia al cuadrado al centro más cercano.
+    b, n = len(kk), len(X)
+    chosen = np.empty((b, kmax), dtype=np.intp)
+    chosen[:, 0] = rng.integers(n, size=b)
+    closest = ((X[None, :, :] - X[chosen[:, 0]][:, None, :]) ** 2).sum(axis=2)
+
+    for j in range(1, kmax):
+        total = closest.sum(axis=1, keepdims=True)
+        # Si todos los puntos coinciden con algún centro se elige al azar.
+        probs = np.where(total > 0, closest / np.where(total > 0, total, 1), 1.0 / n)
+        cdf = np.cumsum(probs, axis=1)
+        r = rng.random((b, 1)) * cdf[:, -1:]
+        chosen[:, j] = np.minimum((cdf < r).sum(axis=1), n - 1)
+        new = ((X[None, :, :] - X[chosen[:, j]][:, None, :]) ** 2).sum(axis=2)
+        closest = np.minimum(closest, new)
+
+    return X[chosen].astype(float)
+
+
+def solve(X, ks, n_init=KMEANS_N_INIT, max_iter=KMEANS_MAX_ITER, seed=KMEANS_SEED):
+    # Devuelve {k: Solution} para cada k de ks que no supere el nº de filas.
+    X = np.asarray(X, dtype=float)
+    n = len(X)
+    ks = [k for k in ks if 1 <= k <= n]
+    if not ks:
+        return {}
+
+    rng = np.random.default_rng(seed)
+    kmax = max(ks)
+    kk = np.repeat(ks, n_init)
+    valid = np.arange(kmax)[None, :] < kk[:, None]
+
+    centers = _init_centers(X, kk, kmax, rng)
+    labels = None
+    for _ in range(max_iter):
+        dist = _distances(X, centers, valid)
+        new_labels = dist.argmin(axis=2)
+        if labels is not None and (new_labels == labels).all():
+            break
+        labels = new_labels
+
+        # Nuevos centros como media de sus puntos; un grupo vacío conserva
+        # su centro anterior.
+        onehot = labels[:, :, None] == np.arange(kmax)[None, None, :]
+        sizes = onehot.sum(axis=1)
+        sums = np.einsum("bnk,nd->bkd", onehot.astype(float), X)
+        centers = np.where(
+            sizes[:, :, None] > 0, sums / np.maximum(sizes, 1)[:, :, None], centers
+        )
+
+    dist = _distances(X, centers, valid)
+    labels = dist.argmin(axis=2)
+    inertia = dist.min(axis=2).sum(axis=1).reshape(len(ks), n_init)
+    best = inertia.argmin(axis=1)
+
+    solutions = {}
+    for i, k in enumerate(ks):
+        run = i * n_init + best[i]
+        solutions[k] = Solution(labels[run], centers[run, :k], float(inertia[i, best[i]]))
+    return solutions
@@ -0,0 +1,187 @@
+import os
+import threading
+import time
+from functools import wraps
+
+from flask import Response, g, has_request_context
+
+# ============================
+# MÉTRICAS DE LATENCIA
+# ============================
+#
+# Cada sección de los callbacks (filtro, KPIs, mapa, ranking, evolución,
+# procesos, treemap, segmentación, codo, mapa de segmentos y serialización
+# de la respuesta) se cronometra y se acumula en un histograma por sección.
+# Las secciones son fases disjuntas: ninguna se ejecuta dentro de otra, así
+# que sus tiempos se pueden sumar. Se exponen de dos formas:
+#   - /metrics en formato de texto de Prometheus;
+#   - la cabecera Server-Timing de cada respuesta de callback, que las
+#     herramientas de desarrollo del navegador muestran desglosada.
+# Los histogramas son por proceso: con varios workers de gunicorn, cada
+# scrape de /metrics ve los del worker que atiende la petición.
+#
+# Los callbacks en segundo plano se ejecutan en un proceso hijo con una
+# copia del contexto de la petición que los lanzó, así que lo que miden se
+# queda en su g. export() lo recoge al terminar el trabajo y merge() lo
+# añade a la petición que devuelve el resultado (app.JobManager): sale en su
+# Server-Timing y se suma a los histogramas de ese worker.
+#
+# Solo cuenta lo que se mide dentro de una petición: el precalentamiento
+# (warmup.py) ejecuta las mismas secciones en un hilo propio y no debe
+# mezclarse con la latencia que ven los usuarios. Las figuras que se
+# construyen en el pool de hilos heredan el contexto de la petición
+# (app.build_all).
+
+SECTIONS = [
+    "filter", "kpis", "map", "ranking", "trend", "processes", "treemap",
+    "segmentation", "elbow", "segment_map", "serialization",
+]
+
+# Límites superiores de los buckets, en segundos.
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+
+class Histogram:
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = {}
+        self.sums = {}
+        self.lock = threading.Lock()
+        os.register_at_fork(after_in_child=self._reset_lock)
+
+    def _reset_lock(self):
+        # Un hijo creado con fork (trabajos en segundo plano de Dash) no
+        # hereda el hilo que pudiera tener el cerrojo en ese momento.
+        self.lock = threading.Lock()
+
+    def observe(self, label, seconds):
+        with self.lock:
+            counts = self.counts.setdefault(label, [0] * (len(self.buckets) + 1))
+            for i, bound in enumerate(self.buckets):
+                if seconds <= bound:
+                    counts[i] += 1
+                    break
+            else:
+                counts[-1] += 1
+            self.sums[label] = self.sums.get(label, 0.0) + seconds
+
+    def render(self, name, label_name, help_text):
+        lines = [f"# HELP {name} {help_text}", f"# TYPE {name} histogram"]
+        with self.lock:
+            for label in sorted(self.counts):
+                cumulative = 0
+                for bound, n in zip(self.buckets + ("+Inf",), self.counts[label]):
+                    cumulative += n
+                    lines.append(f'{name}_bucket{{{label_name}="{label}",le="{bound}"}} {cumulative}')
+                lines.append(f'{name}_sum{{{label_name}="{label}"}} {self.sums[label]:.6f}')
+                lines.append(f'{name}_count{{{label_name}="{label}"}} {cumulative}')
+        return lines
+
+
+sections = Histogram()
+callbacks = Histogram()
+
+# Los hilos del pool de figuras comparten el g de la petición.
+_timings_lock = threading.Lock()
+
+
+def _reset_timings_lock():
+    global _timings_lock
+    _timings_lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_reset_timings_lock)
+
+
+def record(name, seconds):
+    # Dentro de una petición se acumula (una sección puede ejecutarse varias
+    # veces) y se vuelca al histograma al cerrar la respuesta. Fuera de una
+    # petición (precalentamiento) no se registra.
+    if not has_request_context():
+        return
+    with _timings_lock:
+        timings = g.setdefault("timings", {})
+        timings[name] = timings.get(name, 0.0) + seconds
+
+
+def timed(name):
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                record(name, time.perf_counter() - start)
+        return wrapper
+    return decorator
+
+
+def callback(func):
+    # Marca el final del callback: lo que queda hasta cerrar la respuesta es
+    # la serialización de las salidas (JSON de Dash).
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        result = func(*args, **kwargs)
+        end = time.perf_counter()
+        if has_request_context():
+            g.setdefault("callbacks", {})[func.__name__] = end - start
+            g.callback_end = end
+        else:
+            callbacks.observe(func.__name__, end - start)
+        return result
+    return wrapper
+
+
+def export():
+    # Lo medido en esta petición, que deja de contar en ella.
+    if not has_request_context():
+        return {}
+    return {"timings": g.pop("timings", {}), "callbacks": g.pop("callbacks", {})}
+
+
+def merge(sample):
+    # Añade a esta petición lo medido en otro proceso (export). La
+    # serialización de la respuesta se mide desde aquí.
+    timings = g.setdefault("timings", {})
+    for name, seconds in sample.get("timings", {}).items():
+        timings[name] = timings.get(name, 0.0) + seconds
+    g.setdefault("callbacks", {}).update(sample.get("callbacks", {}))
+    g.callback_end = time.perf_counter()
+
+
+def _server_timing(response):
+    timings = g.pop("timings", {})
+    end = g.pop("callback_end", None)
+    if end is not None:
+        timings["serialization"] = time.perf_counter() - end
+
+    for name, seconds in timings.items():
+        sections.observe(name, seconds)
+    for name, seconds in g.pop("callbacks", {}).items():
+        callbacks.observe(name, seconds)
+
+    if timings:
+        response.headers["Server-Timing"] = ", ".join(
+            f"{name};dur={seconds * 1000:.2f}" for name, seconds in timings.items()
+        )
+    return response
+
+
+def _metrics():
+    lines = sections.render(
+        "dashboard_section_seconds", "section",
+        "Duración de cada sección de los callbacks del dashboard.",
+    )
+    lines += callbacks.render(
+        "dashboard_callback_seconds", "callback",
+        "Duración de cada callback sin la serialización.",
+    )
+    return Response("\n".join(lines) + "\n", mimetype="text/plain; version=0.0.4")
+
+
+def register(server):
+    server.after_request(_server_timing)
+    server.add_url_rule("/metrics", "metrics", _metrics)
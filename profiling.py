@@ -0,0 +1,198 @@
+import cProfile
+import collections
+import contextvars
+import hmac
+import os
+import sys
+import threading
+import time
+from functools import wraps
+
+from flask import abort, g, has_request_context, jsonify, request, send_from_directory
+
+# ============================
+# PERFILADO BAJO DEMANDA
+# ============================
+#
+# Perfila invocaciones concretas de los callbacks en producción sin
+# redesplegar. Se activa de dos formas:
+#   - PROFILE_CALLBACKS=cprofile|sampling perfila todas las invocaciones;
+#   - la cabecera X-Profile: cprofile|sampling en una petición, solo si
+#     viene acompañada de X-Admin-Token igual a ADMIN_TOKEN.
+# cprofile guarda un .pstats (python -m pstats, snakeviz...); sampling
+# muestrea la pila cada PROFILE_INTERVAL_MS y guarda pilas colapsadas
+# (.folded), listas para flamegraph.pl o speedscope. Los ficheros van a
+# PROFILE_DIR, que conserva solo los PROFILE_MAX_FILES más recientes.
+#
+# Rutas de administración (requieren la cabecera X-Admin-Token; nunca en la
+# URL, que acaba en los logs de acceso y en el historial del navegador):
+#   /admin/profiles          lista de perfiles (JSON)
+#   /admin/profiles/<name>   descarga de un perfil
+
+PROFILE_DIR = os.environ.get(
+    "PROFILE_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), ".profiles"),
+)
+PROFILE_CALLBACKS = os.environ.get("PROFILE_CALLBACKS", "")
+PROFILE_MAX_FILES = int(os.environ.get("PROFILE_MAX_FILES", 50))
+PROFILE_INTERVAL_MS = float(os.environ.get("PROFILE_INTERVAL_MS", 1))
+ADMIN_TOKEN = os.environ.get("ADMIN_TOKEN", "")
+
+MODES = ("cprofile", "sampling")
+EXTENSIONS = (".pstats", ".folded")
+
+# Modo del perfil en curso en este contexto; lo consulta app.build_all.
+_active = contextvars.ContextVar("profiling_active", default=None)
+
+
+def is_admin():
+    token = request.headers.get("X-Admin-Token", "")
+    return bool(ADMIN_TOKEN) and hmac.compare_digest(token, ADMIN_TOKEN)
+
+
+def requested_mode():
+    if PROFILE_CALLBACKS in MODES:
+        return PROFILE_CALLBACKS
+    if has_request_context():
+        mode = request.headers.get("X-Profile", "")
+        if mode in MODES and is_admin():
+            return mode
+    return None
+
+
+def active():
+    # Los dos perfiladores solo ven el hilo que ejecuta el callback: mientras
+    # hay uno en curso, el trabajo debe hacerse en ese hilo.
+    return _active.get() is not None
+
+
+class Sampler(threading.Thread):
+    """Muestrea la pila de un hilo a intervalos fijos (pilas colapsadas)."""
+
+    def __init__(self, thread_id, interval):
+        super().__init__(daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = collections.Counter()
+        self.done = threading.Event()
+
+    def run(self):
+        while not self.done.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(
+                    f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+                )
+                frame = frame.f_back
+            if stack:
+                self.stacks[";".join(reversed(stack))] += 1
+
+    def stop(self):
+        self.done.set()
+        self.join()
+
+    def dump(self, path):
+        with open(path, "w", encoding="utf-8") as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+
+def _rotate():
+    names = sorted(
+        (n for n in os.listdir(PROFILE_DIR) if n.endswith(EXTENSIONS)),
+        key=lambda n: os.path.getmtime(os.path.join(PROFILE_DIR, n)),
+    )
+    for name in names[:max(len(names) - PROFILE_MAX_FILES, 0)]:
+        try:
+            os.remove(os.path.join(PROFILE_DIR, name))
+        except OSError:
+            pass
+
+
+def _save(name, mode, profiler):
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    now = time.time()
+    stamp = time.strftime("%Y%m%d-%H%M%S", time.localtime(now))
+    filename = f"{stamp}.{int(now * 1000) % 1000:03d}-{name}-{os.getpid()}"
+    if mode == "cprofile":
+        filename += ".pstats"
+        profiler.dump_stats(os.path.join(PROFILE_DIR, filename))
+    else:
+        filename += ".folded"
+        profiler.dump(os.path.join(PROFILE_DIR, filename))
+    _rotate()
+    return filename
+
+
+def profiled(func):
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        mode = requested_mode()
+        if mode is None:
+            return func(*args, **kwargs)
+
+        if mode == "cprofile":
+            profiler = cProfile.Profile()
+            profiler.enable()
+        else:
+            profiler = Sampler(threading.get_ident(), PROFILE_INTERVAL_MS / 1000)
+            profiler.start()
+
+        token = _active.set(mode)
+        try:
+            return func(*args, **kwargs)
+        finally:
+            _active.reset(token)
+            if mode == "cprofile":
+                profiler.disable()
+            else:
+                profiler.stop()
+            filename = _save(func.__name__, mode, profiler)
+            if has_request_context():
+                g.profile_name = filename
+    return wrapper
+
+
+def export():
+    # Perfil guardado en esta petición, para devolverlo desde un trabajo en
+    # segundo plano (ver metrics.export).
+    return g.pop("profile_name", None) if has_request_context() else None
+
+
+def merge(name):
+    if name is not None:
+        g.profile_name = name
+
+
+def _profile_header(response):
+    name = g.pop("profile_name", None)
+    if name is not None:
+        response.headers["X-Profile-Id"] = name
+    return response
+
+
+def _list_profiles():
+    if not is_admin():
+        abort(404)
+    if not os.path.isdir(PROFILE_DIR):
+        return jsonify([])
+    profiles = []
+    for name in sorted(os.listdir(PROFILE_DIR), reverse=True):
+        if name.endswith(EXTENSIONS):
+            st = os.stat(os.path.join(PROFILE_DIR, name))
+            profiles.append({"name": name, "bytes": st.st_size, "mtime": st.st_mtime})
+    return jsonify(profiles)
+
+
+def _download_profile(name):
+    if not is_admin() or not name.endswith(EXTENSIONS):
+        abort(404)
+    return send_from_directory(PROFILE_DIR, name, as_attachment=True)
+
+
+def register(server):
+    server.after_request(_profile_header)
+    server.add_url_rule("/admin/profiles", "profiles", _list_profiles)
+    server.add_url_rule("/admin/profiles/<name>", "profile", _download_profile)
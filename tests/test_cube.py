@@ -0,0 +1,41 @@
+import pandas as pd
+import pytest
+
+from cube import CountCube, RowIndex, YearPrefix
+
+
+@pytest.fixture
+def index():
+    # Filas ordenadas por año y columnas categóricas, como las deja dataset.py.
+    data = pd.DataFrame({
+        "Country": ["Spain", "France", "Spain", "Italy"],
+        "Air Pollutant": ["NO2", "PM10", "NO2", "O3"],
+        "Year": [2010, 2011, 2012, 2012],
+        "Data Aggregation Process": ["P1", "P2", None, "P1"],
+    })
+    for c in ("Country", "Air Pollutant", "Data Aggregation Process"):
+        data[c] = data[c].astype("category")
+    return RowIndex(data)
+
+
+def engines(index):
+    cube = CountCube.from_index(index)
+    return {"cube": cube, "rows": index, "prefix": YearPrefix(cube)}
+
+
+@pytest.mark.parametrize("y0, y1", [(2013, 2015), (2030, 2030), (2005, 2008)])
+def test_years_outside_dataset_give_empty_slice(index, y0, y1):
+    for name, engine in engines(index).items():
+        sel = engine.select(["NO2", "PM10", "O3"], y0, y1)
+        assert sel.years == [], name
+        assert sel.total() == 0, name
+        assert sel.by_year_pollutant().empty, name
+
+
+def test_engines_agree_on_partial_range(index):
+    results = {
+        name: engine.select(["NO2", "PM10", "O3"], 2011, 2030).by_country().to_dict("list")
+        for name, engine in engines(index).items()
+    }
+    assert results["cube"] == results["rows"] == results["prefix"]
+    assert sum(results["cube"]["Model Count"]) == 3
@@ -0,0 +1,37 @@
+import os
+
+from dataset import detect_changes, source_fingerprints
+
+HEADER = "Country,Year\n"
+
+
+def write(path, text):
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        f.write(text)
+
+
+def test_snapshot_only_deployment_has_nothing_to_reload(tmp_path):
+    # Snapshot con las huellas de un CSV que no se ha desplegado.
+    csv = tmp_path / "DataExtract.csv"
+    write(csv, HEADER + "Spain,2020\n")
+    sources = source_fingerprints(str(csv))
+    os.remove(csv)
+
+    assert detect_changes(str(csv), sources) is None
+    assert detect_changes(str(tmp_path / "*.csv"), sources) is None
+
+
+def test_appended_rows_and_removed_extracts(tmp_path):
+    first, second = tmp_path / "a.csv", tmp_path / "b.csv"
+    write(first, HEADER + "Spain,2020\n")
+    write(second, HEADER + "France,2020\n")
+    sources = source_fingerprints(str(tmp_path))
+
+    assert detect_changes(str(tmp_path), sources) is None
+
+    size = os.path.getsize(first)
+    write(first, HEADER + "Spain,2020\nItaly,2021\n")
+    assert detect_changes(str(tmp_path), sources) == [(str(first), size)]
+
+    os.remove(second)
+    assert detect_changes(str(tmp_path), sources) == "full"
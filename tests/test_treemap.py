@@ -0,0 +1,51 @@
+import base64
+import os
+import tempfile
+
+import numpy as np
+import pytest
+
+# app carga el dataset al importarse: sin precalentamiento ni recarga y con
+# la caché y el snapshot fuera del repositorio.
+_tmp = tempfile.mkdtemp()
+os.environ.setdefault("WARMUP", "0")
+os.environ.setdefault("RELOAD_INTERVAL", "0")
+os.environ.setdefault("CACHE_DIR", os.path.join(_tmp, "cache"))
+os.environ.setdefault("SNAPSHOT_DIR", os.path.join(_tmp, "snapshot"))
+
+import app  # noqa: E402
+from cube import CubeSlice  # noqa: E402
+
+
+def decode(array):
+    # Arrays numéricos de las figuras: {"dtype", "bdata"} (figures.py).
+    return np.frombuffer(base64.b64decode(array["bdata"]), dtype="<" + array["dtype"])
+
+
+def many_pollutants(n_pollutants, n_countries):
+    counts = np.arange(1, n_countries * n_pollutants + 1, dtype=np.int32)
+    return CubeSlice(
+        [f"C{i}" for i in range(n_countries)],
+        [f"P{i}" for i in range(n_pollutants)],
+        [2020],
+        ["proc"],
+        counts.reshape(n_countries, n_pollutants, 1, 1),
+    )
+
+
+@pytest.mark.parametrize("max_leaves", [1, 4, 10])
+def test_treemap_respects_leaf_budget_with_many_pollutants(monkeypatch, max_leaves):
+    monkeypatch.setattr(app, "FIGURE_MAX_LEAVES", max_leaves)
+    sel = many_pollutants(n_pollutants=30, n_countries=5)
+
+    trace = app.build_treemap(sel)["data"][0]
+    values = decode(trace["values"])
+    parents = [p for p in trace["parents"] if p == ""]
+    leaves = [p for p in trace["parents"] if p != ""]
+
+    assert len(leaves) <= max_leaves
+    assert len(parents) <= max(1, max_leaves // 2)
+    # Todas las ramas tienen alguna hoja y no se pierde ningún modelo.
+    assert set(leaves) == {i for i, p in zip(trace["ids"], trace["parents"]) if p == ""}
+    assert values[:len(parents)].sum() == sel.total()
+    assert values[len(parents):].sum() == sel.total()
@@ -0,0 +1,123 @@
+import logging
+import os
+import threading
+import time
+
+from flask import jsonify
+
+import datastore
+
+# ============================
+# PRECALENTAMIENTO DE LA CACHÉ
+# ============================
+#
+# Tras cargar el dataset, un hilo calcula en segundo plano las vistas más
+# habituales (las que devuelve la función views de start()) para que estén
+# en la caché de resultados antes de que llegue el tráfico. Cada worker
+# recorre la misma lista: gracias al cálculo único por clave de cache.py,
+# cada vista la calcula un solo worker y el resto la lee de la caché.
+#
+# /health informa del progreso y del tiempo, y responde 503 hasta que el
+# worker ha terminado su primer precalentamiento, para que el balanceador no
+# le mande tráfico antes. Tras una recarga del dataset se vuelve a lanzar
+# para la versión nueva sin dejar de estar listo.
+#
+#   WARMUP=0              desactiva el precalentamiento (listo al arrancar)
+#   WARMUP_POLLUTANTS=n   solo los n contaminantes con más filas (0: todos)
+
+WARMUP = os.environ.get("WARMUP", "1") == "1"
+WARMUP_POLLUTANTS = int(os.environ.get("WARMUP_POLLUTANTS", 0))
+
+log = logging.getLogger(__name__)
+
+
+class Warmup(threading.Thread):
+
+    def __init__(self, version, tasks):
+        super().__init__(daemon=True, name="cache-warmup")
+        self.version = version
+        self.tasks = tasks
+        self.done = 0
+        self.errors = 0
+        self.started = time.perf_counter()
+        self.seconds = None
+        self.cancelled = threading.Event()
+
+    def run(self):
+        global _ready
+        for name, task in self.tasks:
+            if self.cancelled.is_set():
+                return
+            try:
+                task()
+            except Exception:
+                log.exception("Error precalentando %s", name)
+                self.errors += 1
+            self.done += 1
+
+        self.seconds = time.perf_counter() - self.started
+        _ready = True
+        log.info(
+            "Caché precalentada (%s): %d vistas en %.1f s",
+            self.version, self.done, self.seconds,
+        )
+
+    def status(self):
+        running = self.seconds is None
+        return {
+            "version": self.version,
+            "done": self.done,
+            "total": len(self.tasks),
+            "errors": self.errors,
+            "seconds": round(
+                time.perf_counter() - self.started if running else self.seconds, 3
+            ),
+            "running": running and self.is_alive(),
+        }
+
+
+_views = None
+_run = None
+_ready = not WARMUP
+
+
+def ready():
+    return _ready
+
+
+def start(views=None):
+    # views(state) devuelve la lista de (nombre, función) a calcular; se
+    # recuerda para los siguientes arranques (post_fork, recargas).
+    global _views, _run
+    if views is not None:
+        _views = views
+    if not WARMUP or _views is None:
+        return None
+
+    stop()
+    state = datastore.current()
+    _run = Warmup(state.version, _views(state))
+    _run.start()
+    return _run
+
+
+def stop():
+    # Como el vigilante del dataset, el hilo no sobrevive a un fork: el
+    # master de gunicorn lo para antes de crear los workers.
+    if _run is not None and _run.is_alive():
+        _run.cancelled.set()
+        _run.join()
+
+
+def _health():
+    body = {"status": "ready" if _ready else "warming"}
+    state = datastore.current()
+    if state is not None:
+        body["version"] = state.version
+    if _run is not None:
+        body["warmup"] = _run.status()
+    return jsonify(body), 200 if _ready else 503
+
+
+def register(server):
+    server.add_url_rule("/health", "health", _health)